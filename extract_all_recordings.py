@@ -9,6 +9,7 @@ Enhanced Zoom Recordings Extractor - Finds ALL recordings including:
 
 import os
 import json
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional
 from dotenv import load_dotenv
@@ -36,7 +37,8 @@ def extract_all_recordings(
     max_concurrent: int = 2,
     dry_run: bool = True,
     resume: bool = True,
-    max_retries: int = 3
+    max_retries: int = 3,
+    verify_hash: bool = True
 ):
     """
     Extract recordings from ALL users including inactive/deleted ones.
@@ -52,6 +54,7 @@ def extract_all_recordings(
         dry_run: If True, don't actually download files
         resume: Resume from previous state if True
         max_retries: Maximum number of retry attempts for failed downloads (default: 3)
+        verify_hash: If False, skip SHA-256 for files whose size matches
     """
     
     # Set default date range to 2 years if not specified
@@ -91,26 +94,34 @@ def extract_all_recordings(
     edge_handler = EdgeCaseHandler(headers, auth)
     
     if not dry_run:
-        downloader = FileDownloader(headers, max_concurrent, auth=auth)
+        downloader = FileDownloader(headers, max_concurrent, auth=auth, verify_hash=verify_hash)
     
     # Get all users (active + inactive if requested)
     all_users = []
     
-    # Always get active users
-    print("[INFO] Getting active users...")
-    active_users = list(user_enumerator.list_all_users(user_filter, user_type="active"))
-    all_users.extend(active_users)
-    print(f"   Found {len(active_users)} active users")
-    
-    # Get inactive users if requested
-    if include_inactive_users:
-        print("[INFO] Getting inactive users...")
-        try:
-            inactive_users = list(user_enumerator.list_all_users(user_filter, user_type="inactive"))
-            all_users.extend(inactive_users)
-            print(f"   Found {len(inactive_users)} inactive users")
-        except Exception as e:
-            print(f"   [WARN] Could not get inactive users: {e}")
+    # The two listings are independent, so page through inactive users in
+    # the background while active users are fetched
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        inactive_future = None
+        if include_inactive_users:
+            inactive_future = executor.submit(
+                lambda: list(user_enumerator.list_all_users(user_filter, user_type="inactive")))
+        
+        # Always get active users
+        print("[INFO] Getting active users...")
+        active_users = list(user_enumerator.list_all_users(user_filter, user_type="active"))
+        all_users.extend(active_users)
+        print(f"   Found {len(active_users)} active users")
+        
+        # Get inactive users if requested
+        if inactive_future is not None:
+            print("[INFO] Getting inactive users...")
+            try:
+                inactive_users = inactive_future.result()
+                all_users.extend(inactive_users)
+                print(f"   Found {len(inactive_users)} inactive users")
+            except Exception as e:
+                print(f"   [WARN] Could not get inactive users: {e}")
     
     print(f"[TARGET] Total users to process: {len(all_users)}")
     
@@ -149,7 +160,7 @@ def extract_all_recordings(
         
         try:
             # Validate user access
-            user_warnings = edge_handler.check_account_restrictions(user)
+            user_warnings = list(edge_handler.check_account_restrictions(user))
             if user_warnings:
                 print(f"   [WARN] User warnings: {user_warnings}")
             
@@ -172,7 +183,7 @@ def extract_all_recordings(
                         print(f"      [MEETING] Meeting: {meeting_topic}")
                         
                         # Validate meeting access
-                        meeting_warnings = edge_handler.handle_meeting_type_restrictions(recording)
+                        meeting_warnings = list(edge_handler.handle_meeting_type_restrictions(recording))
                         if meeting_warnings:
                             print(f"         [WARN] Meeting warnings: {meeting_warnings}")
                         
@@ -246,7 +257,7 @@ def extract_all_recordings(
         
         # Save progress every 10 users
         if processed_users % 10 == 0:
-            state._save_state()
+            state.flush()
             print(f"   [SAVED] Progress saved ({processed_users}/{len(all_users)} users processed)")
     
     # Final summary
@@ -262,7 +273,12 @@ def extract_all_recordings(
         print(f"[TIP] Run without --dry-run to perform actual downloads")
     
     # Save final state
-    state._save_state()
+    state.close()
+    user_enumerator.close()
+    recordings_lister.close()
+    edge_handler.close()
+    if not dry_run:
+        downloader.close()
     
     # Save summary to log file
     log_file = output_path / "_metadata" / "extraction_summary.log"
@@ -305,6 +321,7 @@ def main():
     parser.add_argument("--dry-run", action="store_true", help="Dry run mode")
     parser.add_argument("--resume", action="store_true", default=True, help="Resume from previous state (default: True)")
     parser.add_argument("--no-resume", action="store_true", help="Don't resume, start fresh")
+    parser.add_argument("--no-verify-hash", action="store_true", help="Skip SHA-256 for downloads whose size matches the API")
     
     args = parser.parse_args()
     
@@ -331,7 +348,8 @@ def main():
             max_concurrent=args.max_concurrent,
             dry_run=args.dry_run,
             resume=resume_enabled,
-            max_retries=args.max_retries
+            max_retries=args.max_retries,
+            verify_hash=not args.no_verify_hash
         )
         
         if "error" in result:
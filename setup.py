@@ -25,7 +25,6 @@ except FileNotFoundError:
         'python-dotenv>=1.0.0',
         'click>=8.1.0',
         'tqdm>=4.66.0',
-        'PyJWT>=2.8.0',
         'python-dateutil>=2.8.0',
     ]
 
@@ -77,6 +76,9 @@ setup(
             "pytest-mock>=3.10.0",
             "responses>=0.23.0",
         ],
+        "speedups": [
+            "orjson>=3.8.0",
+        ],
     },
     entry_points={
         "console_scripts": [
@@ -0,0 +1,77 @@
+"""
+Tests for DirectoryStructure file naming and check_file_exists.
+"""
+
+import tempfile
+import unittest
+
+from zoom_extractor.structure import DirectoryStructure
+
+
+USER = {"id": "user1", "email": "user@example.com"}
+MEETING = {"id": 123, "uuid": "abc==", "topic": "Weekly Sync", "start_time": "2024-12-01T14:00:00Z"}
+FILE_INFO = {
+    "id": "file1",
+    "recording_start": "2024-12-01T14:00:00Z",
+    "file_type": "MP4",
+    "file_extension": "mp4",
+    "file_size": 5
+}
+
+
+class CheckFileExistsTest(unittest.TestCase):
+    """check_file_exists answers from one scandir of the meeting directory."""
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self._tmp.cleanup)
+        self.structure = DirectoryStructure(self._tmp.name)
+        self.file_path = self.structure.get_file_path(USER, MEETING, FILE_INFO)
+
+    def _write(self, data: bytes) -> None:
+        self.file_path.parent.mkdir(parents=True, exist_ok=True)
+        self.file_path.write_bytes(data)
+
+    def test_missing_file(self):
+        exists, path = self.structure.check_file_exists(USER, MEETING, FILE_INFO)
+        self.assertFalse(exists)
+        self.assertEqual(path, self.file_path)
+
+    def test_size_match(self):
+        self._write(b"x" * 5)
+        exists, path = self.structure.check_file_exists(USER, MEETING, FILE_INFO)
+        self.assertTrue(exists)
+        self.assertEqual(path, self.file_path)
+
+    def test_size_mismatch(self):
+        self._write(b"x" * 3)
+        exists, path = self.structure.check_file_exists(USER, MEETING, FILE_INFO)
+        self.assertFalse(exists)
+        self.assertEqual(path, self.file_path)
+
+
+class FileNameTest(unittest.TestCase):
+    """File names only gain a suffix when two files of a meeting would collide."""
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self._tmp.cleanup)
+        self.structure = DirectoryStructure(self._tmp.name)
+
+    def test_unique_names_are_unchanged(self):
+        audio = dict(FILE_INFO, id="file2", file_type="M4A", file_extension="m4a")
+        meeting = dict(MEETING, processed_files=[FILE_INFO, audio])
+        self.assertEqual(self.structure.get_file_path(USER, meeting, FILE_INFO).name, "20241201_140000_MP4.mp4")
+
+    def test_colliding_names_get_recording_type(self):
+        speaker = dict(FILE_INFO, recording_type="active_speaker")
+        gallery = dict(FILE_INFO, id="file2", recording_type="gallery_view")
+        meeting = dict(MEETING, processed_files=[speaker, gallery])
+        self.assertEqual(self.structure.get_file_path(USER, meeting, speaker).name,
+                         "20241201_140000_MP4_active_speaker.mp4")
+        self.assertEqual(self.structure.get_file_path(USER, meeting, gallery).name,
+                         "20241201_140000_MP4_gallery_view.mp4")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -5,14 +5,15 @@ Handles OAuth token acquisition, caching, and refresh for Zoom Server-to-Server
 """
 
 import os
-import json
 import time
 import base64
 import requests
 import logging
-from typing import Dict, Optional, Tuple
+import threading
+from typing import Dict, Optional
 from pathlib import Path
-from datetime import datetime, timedelta
+
+from . import json_compat
 
 logger = logging.getLogger(__name__)
 
@@ -20,6 +21,8 @@ logger = logging.getLogger(__name__)
 class ZoomAuth:
     """Handles Zoom S2S OAuth authentication with automatic token refresh."""
     
+    _CACHE_COMPACT_BYTES = 64 * 1024
+    
     def __init__(self, account_id: str, client_id: str, client_secret: str, 
                  cache_dir: Optional[str] = None):
         """
@@ -35,6 +38,10 @@ class ZoomAuth:
         self.client_id = client_id
         self.client_secret = client_secret
         
+        # Basic auth header for the token endpoint never changes
+        credentials = f"{client_id}:{client_secret}".encode()
+        self._basic_auth = f"Basic {base64.b64encode(credentials).decode()}"
+        
         # Set up cache directory
         if cache_dir is None:
             cache_dir = Path.home() / '.zoom_extractor'
@@ -43,6 +50,11 @@ class ZoomAuth:
         
         self.token_cache_file = self.cache_dir / 'token_cache.json'
         self._token_cache: Dict = {}
+        self._saved_token: Optional[str] = None
+        self._compact_on_save = False
+        self._token_version = 0  # Bumped whenever the cached token changes
+        self._token_lock = threading.Lock()
+        self._ttl_buffer = 300  # Refresh token 5 minutes before expiry
         
         # Load existing token cache
         self._load_token_cache()
@@ -51,18 +63,66 @@ class ZoomAuth:
         """Load token cache from disk."""
         try:
             if self.token_cache_file.exists():
-                with open(self.token_cache_file, 'r') as f:
-                    self._token_cache = json.load(f)
+                data = self.token_cache_file.read_bytes()
+                # Legacy single-document files and torn writes don't end in a
+                # newline; rewrite those instead of appending to them
+                self._compact_on_save = not data.endswith(b'\n')
+                self._token_cache = self._parse_token_cache(data)
+                self._saved_token = self._token_cache.get('access_token')
                 logger.debug("Loaded token cache from disk")
-        except (json.JSONDecodeError, IOError) as e:
+        except (ValueError, IOError) as e:
             logger.warning(f"Failed to load token cache: {e}")
             self._token_cache = {}
     
+    @staticmethod
+    def _parse_token_cache(data: bytes) -> Dict:
+        """
+        Parse the token cache file contents.
+        
+        The cache is an append-only log with one JSON record per line; the
+        last complete record wins. Older cache files hold a single JSON
+        document, which is parsed as a whole.
+        
+        Args:
+            data: Raw cache file contents
+            
+        Returns:
+            Most recent token data dictionary
+        """
+        for line in reversed(data.splitlines()):
+            try:
+                record = json_compat.loads(line)
+            except ValueError:
+                continue  # Torn write or a line of a legacy indented document
+            if isinstance(record, dict):
+                return record
+        return json_compat.loads(data)
+    
     def _save_token_cache(self) -> None:
-        """Save token cache to disk."""
+        """Append the current token to the on-disk cache."""
+        token = self._token_cache.get('access_token')
+        if token == self._saved_token:
+            return
+        
         try:
-            with open(self.token_cache_file, 'w') as f:
-                json.dump(self._token_cache, f, indent=2)
+            record = json_compat.dumps(self._token_cache) + b'\n'
+            
+            try:
+                cache_size = self.token_cache_file.stat().st_size
+            except FileNotFoundError:
+                cache_size = 0
+            
+            if self._compact_on_save or cache_size > self._CACHE_COMPACT_BYTES:
+                # Compact: swap in a file holding only the latest record
+                tmp_file = self.token_cache_file.with_suffix('.json.tmp')
+                tmp_file.write_bytes(record)
+                os.replace(tmp_file, self.token_cache_file)
+            else:
+                with open(self.token_cache_file, 'ab') as f:
+                    f.write(record)
+            
+            self._saved_token = token
+            self._compact_on_save = False
             logger.debug("Saved token cache to disk")
         except IOError as e:
             logger.error(f"Failed to save token cache: {e}")
@@ -81,63 +141,51 @@ class ZoomAuth:
             return False
         
         expires_at = token_data.get('expires_at', 0)
-        # Refresh token 5 minutes before expiry
-        return time.time() < (expires_at - 300)
+        return time.time() < (expires_at - self._ttl_buffer)
     
-    def _generate_jwt_token(self) -> str:
+    def get_access_token(self) -> str:
         """
-        Generate JWT token for S2S OAuth.
+        Get a valid access token, refreshing if necessary.
         
         Returns:
-            JWT token string
+            Valid access token
+            
+        Raises:
+            Exception: If token acquisition fails
         """
-        import jwt
-        
-        # JWT header
-        header = {
-            "alg": "HS256",
-            "typ": "JWT"
-        }
-        
-        # JWT payload
-        now = int(time.time())
-        payload = {
-            "iss": self.client_id,
-            "exp": now + 3600,  # 1 hour expiry
-            "aud": "zoom",
-            "iat": now,
-            "account_id": self.account_id
-        }
+        # Fast path: valid cached token, no locking needed
+        token_cache = self._token_cache
+        cached_token = token_cache.get('access_token')
+        if cached_token and self._is_token_valid(token_cache):
+            return cached_token
         
-        # Encode JWT
-        token = jwt.encode(payload, self.client_secret, algorithm="HS256", headers=header)
-        return token
+        with self._token_lock:
+            # Another thread may have refreshed while we waited for the lock
+            token_cache = self._token_cache
+            cached_token = token_cache.get('access_token')
+            if cached_token and self._is_token_valid(token_cache):
+                logger.debug("Using cached access token")
+                return cached_token
+            
+            return self._refresh_access_token()
     
-    def get_access_token(self) -> str:
+    def _refresh_access_token(self) -> str:
         """
-        Get a valid access token, refreshing if necessary.
+        Request a new access token from Zoom and cache it.
         
         Returns:
-            Valid access token
+            New access token
             
         Raises:
             Exception: If token acquisition fails
         """
-        # Check if we have a valid cached token
-        cached_token = self._token_cache.get('access_token')
-        if cached_token and self._is_token_valid(self._token_cache):
-            logger.debug("Using cached access token")
-            return cached_token
-        
         logger.info("Acquiring new access token")
         
-        # Generate JWT for authentication
-        jwt_token = self._generate_jwt_token()
-        
-        # Request access token
+        # Request access token (account_credentials grant uses Basic auth,
+        # so no JWT needs to be signed here)
         url = "https://zoom.us/oauth/token"
         headers = {
-            "Authorization": f"Basic {base64.b64encode(f'{self.client_id}:{self.client_secret}'.encode()).decode()}",
+            "Authorization": self._basic_auth,
             "Content-Type": "application/x-www-form-urlencoded"
         }
         data = {
@@ -149,7 +197,7 @@ class ZoomAuth:
             response = requests.post(url, headers=headers, data=data, timeout=30)
             response.raise_for_status()
             
-            token_data = response.json()
+            token_data = json_compat.loads(response.content)
             access_token = token_data['access_token']
             expires_in = token_data.get('expires_in', 3600)
             
@@ -159,18 +207,25 @@ class ZoomAuth:
                 'expires_at': time.time() + expires_in,
                 'acquired_at': time.time()
             }
+            self._token_version += 1
             self._save_token_cache()
             
             logger.info("Successfully acquired new access token")
             return access_token
             
-        except requests.exceptions.RequestException as e:
+        except (requests.exceptions.RequestException, ValueError) as e:
+            # ValueError covers a malformed JSON body
             logger.error(f"Failed to acquire access token: {e}")
             raise Exception(f"Token acquisition failed: {e}")
         except KeyError as e:
             logger.error(f"Invalid token response format: {e}")
             raise Exception(f"Invalid token response: missing {e}")
     
+    @property
+    def token_version(self) -> int:
+        """Counter that changes whenever the access token changes."""
+        return self._token_version
+    
     def get_auth_headers(self) -> Dict[str, str]:
         """
         Get authorization headers with valid access token.
@@ -187,6 +242,8 @@ class ZoomAuth:
     def clear_cache(self) -> None:
         """Clear the token cache."""
         self._token_cache = {}
+        self._saved_token = None
+        self._token_version += 1
         try:
             if self.token_cache_file.exists():
                 self.token_cache_file.unlink()
@@ -4,6 +4,7 @@ Date Window Module
 Handles month-by-month date window iteration for Zoom recordings API.
 """
 
+import bisect
 import logging
 from typing import Iterator, Tuple, Optional
 from datetime import datetime, timedelta
@@ -31,6 +32,10 @@ class DateWindowGenerator:
             raise ValueError("from_date cannot be after to_date")
         
         logger.info(f"Date range: {self.from_date.strftime('%Y-%m-%d')} to {self.to_date.strftime('%Y-%m-%d')}")
+        
+        # Windows are fixed for the lifetime of the generator, so compute once
+        self._windows = tuple(self._build_monthly_windows())
+        self._window_starts = [start for start, _ in self._windows]
     
     def _parse_date(self, date_string: str) -> datetime:
         """
@@ -54,9 +59,9 @@ class DateWindowGenerator:
         """Get default from_date (30 days ago)."""
         return datetime.utcnow() - timedelta(days=30)
     
-    def generate_monthly_windows(self) -> Iterator[Tuple[datetime, datetime]]:
+    def _build_monthly_windows(self) -> Iterator[Tuple[datetime, datetime]]:
         """
-        Generate month-by-month date windows.
+        Build month-by-month date windows.
         
         Yields:
             Tuples of (start_date, end_date) for each month
@@ -68,10 +73,6 @@ class DateWindowGenerator:
             next_month = current_start + relativedelta(months=1)
             window_end = min(next_month - timedelta(days=1), self.to_date)
             
-            # Ensure we don't go beyond to_date
-            if current_start > self.to_date:
-                break
-            
             # Set end time to 23:59:59 for the last day
             window_end = window_end.replace(hour=23, minute=59, second=59, microsecond=999999)
             
@@ -82,6 +83,20 @@ class DateWindowGenerator:
             # Move to next month
             current_start = next_month
     
+    def generate_monthly_windows(self) -> Iterator[Tuple[datetime, datetime]]:
+        """
+        Generate month-by-month date windows.
+        
+        Yields:
+            Tuples of (start_date, end_date) for each month
+        """
+        return iter(self._windows)
+    
+    @property
+    def windows(self) -> Tuple[Tuple[datetime, datetime], ...]:
+        """All (start_date, end_date) windows as a reusable tuple."""
+        return self._windows
+    
     def get_total_months(self) -> int:
         """
         Get total number of months in the date range.
@@ -89,16 +104,7 @@ class DateWindowGenerator:
         Returns:
             Number of months
         """
-        start = self.from_date.replace(day=1)
-        end = self.to_date.replace(day=1)
-        
-        months = 0
-        current = start
-        while current <= end:
-            months += 1
-            current += relativedelta(months=1)
-        
-        return months
+        return len(self._windows)
     
     def get_current_window_info(self) -> Tuple[int, int]:
         """
@@ -107,13 +113,13 @@ class DateWindowGenerator:
         Returns:
             Tuple of (current_window, total_windows)
         """
-        total_months = self.get_total_months()
-        current_month = 1
+        total_months = len(self._windows)
+        now = datetime.utcnow()
         
-        for window_start, window_end in self.generate_monthly_windows():
-            if window_start <= datetime.utcnow() <= window_end:
-                return (current_month, total_months)
-            current_month += 1
+        # Windows are sorted and contiguous, so binary search for the current one
+        index = bisect.bisect_right(self._window_starts, now)
+        if index > 0 and now <= self._windows[index - 1][1]:
+            return (index, total_months)
         
         return (total_months, total_months)
 
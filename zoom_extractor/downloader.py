@@ -5,60 +5,181 @@ Handles downloading recording files with resume capability, rate limiting, and r
 """
 
 import os
+import sys
+import ctypes
+import errno
+import shutil
 import hashlib
 import logging
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import HTTPError as Urllib3HTTPError
 import time
-from typing import Dict, Optional, Tuple
+import itertools
+from typing import Dict, Iterable, Iterator, Optional, Tuple
 from pathlib import Path
-from urllib.parse import urlparse, parse_qs
 import threading
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from . import json_compat
 
 logger = logging.getLogger(__name__)
 
+# fallocate(2) with FALLOC_FL_KEEP_SIZE reserves blocks without changing the
+# file size, so a partial file's size still counts only the bytes written.
+# posix_fallocate would grow the file to its full size up front, and a run
+# killed mid-download would leave a zero-filled file that looks complete
+_FALLOC_FL_KEEP_SIZE = 0x01
+_fallocate = None
+if sys.platform.startswith("linux"):
+    try:
+        _fallocate = ctypes.CDLL(None, use_errno=True).fallocate
+        _fallocate.argtypes = (ctypes.c_int, ctypes.c_int, ctypes.c_longlong, ctypes.c_longlong)
+        _fallocate.restype = ctypes.c_int
+    except (OSError, AttributeError):
+        _fallocate = None
+
+
+class _HashingWriter:
+    """File-like proxy that feeds every written chunk into a hash object."""
+    
+    def __init__(self, f, hasher):
+        self._f = f
+        self._hasher = hasher
+    
+    def write(self, data) -> int:
+        self._hasher.update(data)
+        return self._f.write(data)
+
 
 class FileDownloader:
     """Handles downloading files with resume capability and rate limiting."""
     
     def __init__(self, auth_headers: Dict[str, str], max_concurrent: int = 2, 
-                 chunk_size: int = 8388608, timeout: int = 300, auth=None):
+                 chunk_size: int = 8388608, timeout: int = 300, auth=None,
+                 range_threshold: int = 104857600, range_parts: int = 4,
+                 verify_hash: bool = True, meta_dir: Optional[str] = None):
         """
         Initialize file downloader.
         
         Args:
             auth_headers: Authorization headers for requests
             max_concurrent: Maximum concurrent downloads
-            chunk_size: Chunk size for streaming downloads (default 8MB)
+            chunk_size: Read size when copying from the response stream (default 8MB)
             timeout: Request timeout in seconds
             auth: Optional ZoomAuth instance for automatic token refresh
+            range_threshold: File size above which parallel range requests are used (default 100MB)
+            range_parts: Number of parallel range requests per large file (1 disables)
+            verify_hash: Whether to record a SHA-256 for files whose size matches file_size
+            meta_dir: Directory for the cache validators of finished downloads, used
+                to revalidate them on reruns (disabled if None)
         """
         self.auth_headers = auth_headers
         self.auth = auth
+        self._cached_headers = None  # (token_version, headers)
         self.max_concurrent = max_concurrent
         self.chunk_size = chunk_size
         self.timeout = timeout
         self._rate_limit_lock = threading.Lock()
         self._last_request_time = 0
         self._min_request_interval = 0.1  # 100ms between requests
+        self.range_threshold = range_threshold
+        self.range_parts = range_parts
+        self.verify_hash = verify_hash
+        self.meta_dir = Path(meta_dir) if meta_dir else None
+        if self.meta_dir:
+            self.meta_dir.mkdir(parents=True, exist_ok=True)
+        self._executor = None
+        self._range_executor = None
+        self._executor_lock = threading.Lock()
+        
+        # Per-thread sessions: each worker keeps its own keep-alive pool so
+        # concurrent downloads don't contend on a shared connection pool
+        self._tls = threading.local()
+        self._sessions = []
+        self._sessions_lock = threading.Lock()
+    
+    def _session(self) -> requests.Session:
+        """Get the HTTP session for the current thread, creating it on first use."""
+        session = getattr(self._tls, "session", None)
+        if session is None:
+            session = requests.Session()
+            session.mount("https://", HTTPAdapter(pool_maxsize=4, max_retries=0))
+            # Resolve proxy and CA bundle settings from the environment once;
+            # with trust_env requests re-reads them (and ~/.netrc) per request
+            session.proxies.update(requests.utils.get_environ_proxies("https://zoom.us"))
+            ca_bundle = os.environ.get("REQUESTS_CA_BUNDLE") or os.environ.get("CURL_CA_BUNDLE")
+            if ca_bundle:
+                session.verify = ca_bundle
+            session.trust_env = False
+            self._tls.session = session
+            with self._sessions_lock:
+                self._sessions.append(session)
+        return session
+    
+    def close(self) -> None:
+        """Shut down worker threads and close all HTTP sessions."""
+        with self._sessions_lock:
+            sessions, self._sessions = self._sessions, []
+        with self._executor_lock:
+            executors = [self._executor, self._range_executor]
+            self._executor = self._range_executor = None
+        for executor in executors:
+            if executor is not None:
+                executor.shutdown(wait=True)
+        for session in sessions:
+            session.close()
+        # Worker threads that are still alive will create a fresh session
+        self._tls = threading.local()
     
     def _get_headers(self) -> Dict[str, str]:
-        """Get fresh auth headers, refreshing token if needed."""
+        """
+        Get fresh auth headers, refreshing token if needed.
+        
+        The returned dict is shared between requests and must not be mutated.
+        """
         if self.auth:
-            return self.auth.get_auth_headers()
+            self.auth.get_access_token()  # Refreshes an expiring token
+            cached = self._cached_headers
+            if cached is None or cached[0] != self.auth.token_version:
+                cached = (self.auth.token_version, self.auth.get_auth_headers())
+                self._cached_headers = cached
+            return cached[1]
         return self.auth_headers
     
     def _apply_rate_limit(self) -> None:
         """Apply rate limiting between requests."""
+        # Reserve the next slot under the lock but sleep outside it, so
+        # workers wait for their own slot in parallel instead of in turn
         with self._rate_limit_lock:
             current_time = time.time()
-            time_since_last = current_time - self._last_request_time
-            
-            if time_since_last < self._min_request_interval:
-                sleep_time = self._min_request_interval - time_since_last
-                time.sleep(sleep_time)
+            sleep_time = max(0.0, self._last_request_time + self._min_request_interval - current_time)
+            self._last_request_time = current_time + sleep_time
+        
+        if sleep_time > 0:
+            time.sleep(sleep_time)
+    
+    def _preallocate(self, f, size: int) -> None:
+        """
+        Reserve disk space for a file up front where the platform supports it.
+        
+        The file size is left as it is; only blocks past the end are reserved.
+        
+        Args:
+            f: Open binary file object
+            size: Number of bytes to reserve
             
-            self._last_request_time = time.time()
+        Raises:
+            OSError: If there is not enough disk space
+        """
+        if _fallocate is None:
+            return
+        if _fallocate(f.fileno(), _FALLOC_FL_KEEP_SIZE, 0, size) != 0:
+            err = ctypes.get_errno()
+            if err == errno.ENOSPC:
+                raise OSError(err, os.strerror(err), str(f.name))
+            # Filesystem doesn't support it, let the file grow as written
+            logger.debug(f"Could not preallocate {f.name}: {os.strerror(err)}")
     
     def _get_download_url_with_auth(self, download_url: str, access_token: str) -> str:
         """
@@ -73,18 +194,11 @@ class FileDownloader:
         """
         # Try Authorization header first (preferred method)
         # If that fails, we'll fall back to query parameter
-        
-        # Check if URL already has query parameters
-        parsed_url = urlparse(download_url)
-        if parsed_url.query:
-            # URL already has query params, append access_token
-            separator = "&" if "?" in download_url else "?"
-            return f"{download_url}{separator}access_token={access_token}"
-        else:
-            # No existing query params
-            return f"{download_url}?access_token={access_token}"
+        separator = "&" if "?" in download_url else "?"
+        return f"{download_url}{separator}access_token={access_token}"
     
-    def _download_with_headers(self, url: str, file_path: Path, expected_size: Optional[int] = None) -> bool:
+    def _download_with_headers(self, url: str, file_path: Path, expected_size: Optional[int] = None,
+                               hasher=None, validators: Optional[Dict] = None) -> bool:
         """
         Download file using Authorization header (preferred method).
         
@@ -92,6 +206,8 @@ class FileDownloader:
             url: Download URL
             file_path: Target file path
             expected_size: Expected file size for validation
+            hasher: Optional fresh hashlib object, updated with the file's full contents
+            validators: Optional dict, filled with the response's cache validators
             
         Returns:
             True if download successful, False otherwise
@@ -99,28 +215,32 @@ class FileDownloader:
         try:
             self._apply_rate_limit()
             
-            headers = self._get_headers().copy()
+            headers = self._get_headers()
             
             # Check if file already exists and get current size for resume
-            resume_header = {}
-            initial_pos = 0
-            if file_path.exists():
-                initial_pos = file_path.stat().st_size
+            try:
+                initial_pos = os.stat(file_path).st_size
+            except FileNotFoundError:
+                initial_pos = 0
+            else:
                 if expected_size and initial_pos == expected_size:
                     logger.debug(f"File {file_path} already exists with correct size, skipping")
+                    if hasher is not None:
+                        self._update_hash_from_file(hasher, file_path)
                     return True
                 if initial_pos > 0:
-                    resume_header["Range"] = f"bytes={initial_pos}-"
-            
-            headers.update(resume_header)
+                    headers = {**headers, "Range": f"bytes={initial_pos}-"}
             
             logger.debug(f"Downloading {url} to {file_path} (resume from {initial_pos})")
             
-            with requests.get(url, headers=headers, stream=True, timeout=self.timeout) as response:
+            with self._session().get(url, headers=headers, stream=True, timeout=self.timeout) as response:
                 # Handle different response codes
                 if response.status_code == 206:  # Partial content (resume)
                     logger.debug(f"Resuming download from byte {initial_pos}")
                     mode = "ab"
+                    if hasher is not None:
+                        # Seed the hash with the bytes we already have
+                        self._update_hash_from_file(hasher, file_path)
                 elif response.status_code == 200:  # Full content
                     if initial_pos > 0:
                         # Server doesn't support resume, start over
@@ -131,6 +251,9 @@ class FileDownloader:
                     logger.error(f"Unexpected response code {response.status_code} for {url}")
                     return False
                 
+                if validators is not None:
+                    validators.update(self._get_validators(response))
+                
                 # Validate content length if provided
                 content_length = response.headers.get("content-length")
                 if content_length:
@@ -138,21 +261,140 @@ class FileDownloader:
                     if expected_size and total_size != expected_size:
                         logger.warning(f"Size mismatch: expected {expected_size}, got {total_size}")
                 
-                # Download file
+                # Download file (copy straight from the raw stream in C)
+                response.raw.decode_content = True
                 with open(file_path, mode) as f:
-                    for chunk in response.iter_content(chunk_size=self.chunk_size):
-                        if chunk:
-                            f.write(chunk)
+                    if mode == "wb" and expected_size:
+                        self._preallocate(f, expected_size)
+                    dst = _HashingWriter(f, hasher) if hasher is not None else f
+                    try:
+                        shutil.copyfileobj(response.raw, dst, length=self.chunk_size)
+                    finally:
+                        # Release any reserved blocks past what was written
+                        f.truncate()
                 
                 logger.debug(f"Downloaded {url} to {file_path}")
                 return True
                 
-        except requests.exceptions.RequestException as e:
+        except (requests.exceptions.RequestException, Urllib3HTTPError) as e:
+            # Reading response.raw directly surfaces urllib3 errors unwrapped
             logger.error(f"Failed to download {url} with headers: {e}")
             return False
     
+    def _get_executor(self) -> ThreadPoolExecutor:
+        """Get the shared executor for file downloads, creating it on first use."""
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_concurrent,
+                                                    thread_name_prefix="download")
+            return self._executor
+    
+    def _get_range_executor(self) -> ThreadPoolExecutor:
+        """Get the shared executor for range requests, creating it on first use."""
+        with self._executor_lock:
+            if self._range_executor is None:
+                self._range_executor = ThreadPoolExecutor(
+                    max_workers=self.max_concurrent * self.range_parts,
+                    thread_name_prefix="range")
+            return self._range_executor
+    
+    def _download_range(self, url: str, file_path: Path, start: int, end: int,
+                        validators: Optional[Dict] = None) -> Optional[bool]:
+        """
+        Download one byte range into its place in a pre-sized file.
+        
+        Args:
+            url: Download URL
+            file_path: Target file path (must already exist)
+            start: First byte offset
+            end: Last byte offset (inclusive)
+            validators: Optional dict, filled with the response's cache validators
+            
+        Returns:
+            True if the range was written, False on failure, None if the server ignored the Range header
+        """
+        try:
+            self._apply_rate_limit()
+            
+            headers = {**self._get_headers(), "Range": f"bytes={start}-{end}"}
+            
+            with self._session().get(url, headers=headers, stream=True, timeout=self.timeout) as response:
+                if response.status_code == 200:
+                    return None
+                if response.status_code != 206:
+                    logger.error(f"Unexpected response code {response.status_code} for range {start}-{end} of {url}")
+                    return False
+                
+                if validators is not None:
+                    validators.update(self._get_validators(response))
+                
+                response.raw.decode_content = True
+                with open(file_path, "r+b") as f:
+                    f.seek(start)
+                    shutil.copyfileobj(response.raw, f, length=self.chunk_size)
+                    if f.tell() != end + 1:
+                        logger.error(f"Short read for range {start}-{end} of {url}: ended at {f.tell()}")
+                        return False
+                return True
+                
+        except (requests.exceptions.RequestException, Urllib3HTTPError, OSError) as e:
+            logger.error(f"Failed to download range {start}-{end} of {url}: {e}")
+            return False
+    
+    def _download_ranges(self, url: str, file_path: Path, total_size: int, n_parts: int = 4,
+                         validators: Optional[Dict] = None) -> Optional[bool]:
+        """
+        Download a file as parallel byte ranges using Authorization header.
+        
+        The ranges are written into a pre-sized sibling file ending in
+        .ranges.part, which is only moved to file_path once every range
+        has arrived; file_path is never left full-sized with holes in it.
+        
+        Args:
+            url: Download URL
+            file_path: Target file path
+            total_size: Total file size in bytes
+            n_parts: Number of ranges to fetch in parallel
+            validators: Optional dict, filled with the response's cache validators
+            
+        Returns:
+            True if download successful, False on failure, None if the server
+            doesn't support range requests and a single stream should be used
+        """
+        part_size = -(-total_size // n_parts)
+        ranges = [(start, min(start + part_size, total_size) - 1)
+                  for start in range(0, total_size, part_size)]
+        
+        logger.debug(f"Downloading {url} to {file_path} in {len(ranges)} ranges")
+        
+        ranges_path = file_path.with_suffix(".ranges.part")
+        try:
+            with open(ranges_path, "wb") as f:
+                self._preallocate(f, total_size)
+                f.truncate(total_size)
+        except OSError as e:
+            logger.error(f"Failed to create {ranges_path}: {e}")
+            return False
+        
+        executor = self._get_range_executor()
+        futures = [executor.submit(self._download_range, url, ranges_path, start, end, validators)
+                   for start, end in ranges]
+        results = [future.result() for future in futures]
+        
+        if all(result is True for result in results):
+            os.replace(ranges_path, file_path)
+            logger.debug(f"Downloaded {url} to {file_path}")
+            return True
+        
+        ranges_path.unlink()
+        if None in results:
+            logger.info(f"Server doesn't support range requests for {url}, using a single stream")
+            return None
+        return False
+    
     def _download_with_query_param(self, download_url: str, file_path: Path, 
-                                 access_token: str, expected_size: Optional[int] = None) -> bool:
+                                 access_token: str, expected_size: Optional[int] = None,
+                                 hasher=None, validators: Optional[Dict] = None) -> bool:
         """
         Download file using access_token query parameter (fallback method).
         
@@ -161,6 +403,8 @@ class FileDownloader:
             file_path: Target file path
             access_token: OAuth access token
             expected_size: Expected file size for validation
+            hasher: Optional fresh hashlib object, updated with the file's full contents
+            validators: Optional dict, filled with the response's cache validators
             
         Returns:
             True if download successful, False otherwise
@@ -173,24 +417,124 @@ class FileDownloader:
             
             logger.debug(f"Downloading {url} to {file_path} (using query param auth)")
             
-            with requests.get(url, stream=True, timeout=self.timeout) as response:
+            with self._session().get(url, stream=True, timeout=self.timeout) as response:
                 if response.status_code != 200:
                     logger.error(f"Unexpected response code {response.status_code} for {url}")
                     return False
                 
-                # Download file
+                if validators is not None:
+                    validators.update(self._get_validators(response))
+                
+                # Download file (copy straight from the raw stream in C)
+                response.raw.decode_content = True
                 with open(file_path, "wb") as f:
-                    for chunk in response.iter_content(chunk_size=self.chunk_size):
-                        if chunk:
-                            f.write(chunk)
+                    if expected_size:
+                        self._preallocate(f, expected_size)
+                    dst = _HashingWriter(f, hasher) if hasher is not None else f
+                    try:
+                        shutil.copyfileobj(response.raw, dst, length=self.chunk_size)
+                    finally:
+                        # Release any reserved blocks past what was written
+                        f.truncate()
                 
                 logger.debug(f"Downloaded {url} to {file_path}")
                 return True
                 
-        except requests.exceptions.RequestException as e:
+        except (requests.exceptions.RequestException, Urllib3HTTPError) as e:
             logger.error(f"Failed to download {url} with query param: {e}")
             return False
     
+    def _get_validators(self, response: requests.Response) -> Dict[str, Optional[str]]:
+        """Extract cache validators from a download response."""
+        return {
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified")
+        }
+    
+    def _get_meta_path(self, target_path: Path) -> Path:
+        """Get the metadata file that records cache validators for a download."""
+        key = hashlib.blake2b(os.path.abspath(target_path).encode(), digest_size=16).hexdigest()
+        return self.meta_dir / f"{key}.json"
+    
+    def _load_download_meta(self, target_path: Path) -> Optional[Dict]:
+        """
+        Load the metadata for a previously downloaded file.
+        
+        The metadata is only returned while the file on disk still has the
+        size and modification time recorded with it, so a truncated or
+        replaced file is downloaded again rather than revalidated.
+        
+        Args:
+            target_path: Downloaded file path
+            
+        Returns:
+            Download metadata, or None if missing, unreadable or stale
+        """
+        if self.meta_dir is None:
+            return None
+        try:
+            with open(self._get_meta_path(target_path), "rb") as f:
+                meta = json_compat.loads(f.read())
+            stat = target_path.stat()
+        except (ValueError, IOError):
+            return None
+        if not isinstance(meta, dict):
+            return None
+        if meta.get("size") != stat.st_size or meta.get("mtime_ns") != stat.st_mtime_ns:
+            logger.debug(f"{target_path} changed since it was downloaded, not revalidating")
+            return None
+        return meta
+    
+    def _save_download_meta(self, target_path: Path, validators: Dict, size: int,
+                            sha256: Optional[str]) -> None:
+        """
+        Save cache validators for a downloaded file so reruns can skip it.
+        
+        Args:
+            target_path: Downloaded file path
+            validators: Cache validators from the download response
+            size: File size in bytes
+            sha256: File hash, if computed
+        """
+        if self.meta_dir is None or (not validators.get("etag") and not validators.get("last_modified")):
+            return
+        
+        try:
+            meta = dict(validators, path=str(target_path), size=size, sha256=sha256,
+                        mtime_ns=target_path.stat().st_mtime_ns)
+            with open(self._get_meta_path(target_path), "wb") as f:
+                f.write(json_compat.dumps(meta))
+        except IOError as e:
+            logger.warning(f"Failed to save download metadata for {target_path}: {e}")
+    
+    def _is_not_modified(self, url: str, meta: Dict) -> bool:
+        """
+        Ask the server whether a previously downloaded file has changed.
+        
+        Args:
+            url: Download URL
+            meta: Download metadata with cache validators
+            
+        Returns:
+            True if the server answered 304 Not Modified, False otherwise
+        """
+        headers = dict(self._get_headers())
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+        
+        try:
+            self._apply_rate_limit()
+            
+            # Streamed so a 200 doesn't pull the body; the real download follows
+            with self._session().get(url, headers=headers, stream=True, timeout=self.timeout) as response:
+                return response.status_code == 304
+                
+        except requests.exceptions.RequestException as e:
+            logger.debug(f"Conditional request failed for {url}: {e}")
+            return False
+    
     def download_file(self, file_info: Dict, target_path: Path, access_token: str, 
                      max_retries: int = 3) -> Tuple[bool, Dict]:
         """
@@ -212,9 +556,31 @@ class FileDownloader:
         # Create target directory
         target_path.parent.mkdir(parents=True, exist_ok=True)
         
+        # A file we downloaded before can be revalidated instead of fetched again
+        meta = self._load_download_meta(target_path)
+        if meta and self._is_not_modified(download_url, meta):
+            actual_size = meta["size"]
+            logger.info(f"Not modified since last download, keeping {file_id} ({actual_size} bytes)")
+            return True, {
+                "file_id": file_id,
+                "file_type": file_info.get("file_type"),
+                "file_size": actual_size,
+                "expected_size": expected_size,
+                "sha256": meta.get("sha256"),
+                "download_url": download_url,
+                "status": "not_modified"
+            }
+        
         # Use temporary file during download
         temp_path = target_path.with_suffix(target_path.suffix + ".part")
         
+        # A ranged download killed part-way leaves a full-sized file with holes
+        # and no record of which ranges arrived, so it is never resumed
+        try:
+            os.unlink(temp_path.with_suffix(".ranges.part"))
+        except FileNotFoundError:
+            pass
+        
         # Retry loop
         for attempt in range(max_retries):
             if attempt > 0:
@@ -238,12 +604,29 @@ class FileDownloader:
                 time.sleep(wait_time)
             
             # Try Authorization header method first (preferred)
-            success = self._download_with_headers(download_url, temp_path, expected_size)
+            # The hash is computed while streaming, so no second read is needed
+            hasher = hashlib.sha256() if self.verify_hash else None
+            validators = {}
+            success = None
+            
+            # Large files are fetched as parallel ranges, unless resuming a partial download
+            if (self.range_parts > 1 and expected_size and expected_size >= self.range_threshold
+                    and not temp_path.exists()):
+                success = self._download_ranges(download_url, temp_path, expected_size, self.range_parts,
+                                                validators)
+                if success:
+                    hasher = None
+            
+            if success is None:
+                success = self._download_with_headers(download_url, temp_path, expected_size, hasher,
+                                                      validators)
             
             # If that fails, try query parameter method
             if not success:
                 logger.warning(f"Header auth failed for {file_id}, trying query param auth")
-                success = self._download_with_query_param(download_url, temp_path, access_token, expected_size)
+                hasher = hashlib.sha256() if self.verify_hash else None
+                success = self._download_with_query_param(download_url, temp_path, access_token,
+                                                          expected_size, hasher, validators)
             
             # If successful, break out of retry loop
             if success:
@@ -259,12 +642,18 @@ class FileDownloader:
             if expected_size and actual_size != expected_size:
                 logger.warning(f"Size mismatch for {file_id}: expected {expected_size}, got {actual_size}")
             
-            # Calculate SHA-256 hash
-            file_hash = self._calculate_file_hash(temp_path)
+            if hasher is not None:
+                file_hash = hasher.hexdigest()
+            elif not self.verify_hash and actual_size == expected_size:
+                # Size matches what Zoom reported, trust it without hashing
+                file_hash = None
+            else:
+                file_hash = self._calculate_file_hash(temp_path)
             
-            # Atomically rename temp file to final name
-            if temp_path.exists():
-                temp_path.rename(target_path)
+            # Atomically rename temp file to final name (replaces on Windows too)
+            os.replace(temp_path, target_path)
+            
+            self._save_download_meta(target_path, validators, actual_size, file_hash)
             
             # Return success with file stats
             stats = {
@@ -282,8 +671,10 @@ class FileDownloader:
         
         else:
             # Clean up temp file on failure
-            if temp_path.exists():
-                temp_path.unlink()
+            try:
+                os.unlink(temp_path)
+            except FileNotFoundError:
+                pass
             
             logger.error(f"Failed to download {file_id}")
             return False, {
@@ -296,6 +687,18 @@ class FileDownloader:
                 "status": "failed"
             }
     
+    def _update_hash_from_file(self, hasher, file_path: Path) -> None:
+        """
+        Feed the existing contents of a file into a hash object.
+        
+        Args:
+            hasher: hashlib object to update
+            file_path: Path to file
+        """
+        with open(file_path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                hasher.update(chunk)
+    
     def _calculate_file_hash(self, file_path: Path) -> str:
         """
         Calculate SHA-256 hash of a file.
@@ -306,42 +709,55 @@ class FileDownloader:
         Returns:
             SHA-256 hash as hex string
         """
-        sha256_hash = hashlib.sha256()
         with open(file_path, "rb") as f:
-            for chunk in iter(lambda: f.read(4096), b""):
+            # hashlib.file_digest (Python 3.11+) reads in C with a large buffer
+            if hasattr(hashlib, "file_digest"):
+                return hashlib.file_digest(f, "sha256").hexdigest()
+            
+            sha256_hash = hashlib.sha256()
+            for chunk in iter(lambda: f.read(1 << 20), b""):
                 sha256_hash.update(chunk)
         return sha256_hash.hexdigest()
     
-    def download_files_concurrent(self, downloads: list, access_token: str, max_retries: int = 3) -> list:
+    def iter_downloads_concurrent(self, downloads: Iterable, access_token: str,
+                                  max_retries: int = 3) -> Iterator[Tuple[Dict, Path, bool, Dict]]:
         """
-        Download multiple files concurrently with rate limiting.
+        Download files concurrently, yielding results as they complete.
+        
+        At most 2 * max_concurrent downloads are queued at once, so
+        downloads may be a lazy iterable of any length.
         
         Args:
-            downloads: List of (file_info, target_path) tuples
+            downloads: Iterable of (file_info, target_path) tuples
             access_token: OAuth access token
             max_retries: Maximum number of retry attempts (default: 3)
             
-        Returns:
-            List of download results
+        Yields:
+            Tuples of (file_info, target_path, success, file_stats) in
+            completion order, so callers can match results to their tasks
         """
-        results = []
+        executor = self._get_executor()
+        window = self.max_concurrent * 2
+        downloads = iter(downloads)
+        pending = {}
         
-        with ThreadPoolExecutor(max_workers=self.max_concurrent) as executor:
-            # Submit all download tasks
-            future_to_download = {
-                executor.submit(self.download_file, file_info, target_path, access_token, max_retries): (file_info, target_path)
-                for file_info, target_path in downloads
-            }
+        while True:
+            # Top the window up before waiting on the next completion
+            for file_info, target_path in itertools.islice(downloads, window - len(pending)):
+                future = executor.submit(self.download_file, file_info, target_path, access_token, max_retries)
+                pending[future] = (file_info, target_path)
+            
+            if not pending:
+                return
             
-            # Process completed downloads
-            for future in as_completed(future_to_download):
-                file_info, target_path = future_to_download[future]
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                file_info, target_path = pending.pop(future)
                 try:
                     success, stats = future.result()
-                    results.append((success, stats))
                 except Exception as e:
                     logger.error(f"Download task failed for {file_info.get('id', 'unknown')}: {e}")
-                    results.append((False, {
+                    success, stats = False, {
                         "file_id": file_info.get("id", "unknown"),
                         "file_type": file_info.get("file_type"),
                         "file_size": 0,
@@ -350,6 +766,20 @@ class FileDownloader:
                         "download_url": file_info.get("download_url"),
                         "status": "error",
                         "error": str(e)
-                    }))
+                    }
+                yield file_info, target_path, success, stats
+    
+    def download_files_concurrent(self, downloads: list, access_token: str, max_retries: int = 3) -> list:
+        """
+        Download multiple files concurrently with rate limiting.
         
-        return results
+        Args:
+            downloads: List of (file_info, target_path) tuples
+            access_token: OAuth access token
+            max_retries: Maximum number of retry attempts (default: 3)
+            
+        Returns:
+            List of download results
+        """
+        return [(success, stats) for _, _, success, stats
+                in self.iter_downloads_concurrent(downloads, access_token, max_retries)]
@@ -6,27 +6,88 @@ Handles various edge cases and "gotchas" mentioned in the specification.
 
 import logging
 import requests
-from typing import Dict, List, Optional, Tuple
-from datetime import datetime, timedelta
-from urllib.parse import quote, urlparse, parse_qs
+from functools import lru_cache
+from types import MappingProxyType
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from typing import Dict, Iterator, Optional, Tuple
+from datetime import datetime, timedelta, timezone
+from urllib.parse import urlparse, urlsplit, urlunsplit, parse_qs
+
+from .recordings import encode_meeting_uuid
 
 logger = logging.getLogger(__name__)
 
+# The same download URL is parsed by several checks per file; ParseResult
+# is immutable, so results can be shared
+_cached_urlparse = lru_cache(maxsize=4096)(urlparse)
+_cached_urlsplit = lru_cache(maxsize=4096)(urlsplit)
+
+
+def _append_access_token(url: str, access_token: str) -> str:
+    """Add an access_token query parameter, keeping any existing query and fragment."""
+    parts = _cached_urlsplit(url)
+    query = parts.query.rstrip("&")
+    query = f"{query}&access_token={access_token}" if query else f"access_token={access_token}"
+    return urlunsplit(parts._replace(query=query))
+
+
+def _normalize(value) -> str:
+    """Lower-case an API field for comparison; missing values become ''."""
+    if not value:
+        return ""
+    if isinstance(value, str):
+        return value.lower()
+    return str(value).lower()
+
 
 class EdgeCaseHandler:
     """Handles various edge cases and special scenarios."""
     
-    def __init__(self, auth_headers: Dict[str, str], auth=None):
+    # Headers for the query-param download method never change
+    _QUERY_PARAM_HEADERS = MappingProxyType({"User-Agent": "Zoom-Extractor/1.0"})
+    
+    def __init__(self, auth_headers: Dict[str, str], auth=None,
+                 session: Optional[requests.Session] = None):
         """
         Initialize edge case handler.
         
         Args:
             auth_headers: Authorization headers for API requests
             auth: Optional ZoomAuth instance for automatic token refresh
+            session: Optional requests.Session to share (one is created if omitted)
         """
         self.auth_headers = auth_headers
         self.auth = auth
         self.base_url = "https://api.zoom.us/v2"
+        self._head_supported = None  # Learned from the first trash probe
+        # One-year retention cutoff in naive UTC, fixed for the run so every
+        # recording is judged against the same instant
+        self._retention_cutoff = datetime.utcnow() - timedelta(days=365)
+        self._retention_cutoff_iso = self._retention_cutoff.strftime("%Y-%m-%dT%H:%M:%S")
+        
+        # Keep-alive session so repeated probes reuse one TLS connection.
+        # requests already sends Accept-Encoding: gzip, and probe bodies are
+        # read in full: closing an unread response drops the pooled connection.
+        # 429 is left to callers: Zoom's daily-limit Retry-After can be hours
+        self._owns_session = session is None
+        if session is None:
+            session = requests.Session()
+            retry = Retry(total=3, backoff_factor=0.3, status_forcelist=(500, 502, 503, 504),
+                          raise_on_status=False)
+            session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=retry))
+        self.session = session
+    
+    def close(self) -> None:
+        """Close the HTTP session if this handler created it."""
+        if self._owns_session:
+            self.session.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
     
     def _get_headers(self) -> Dict[str, str]:
         """Get fresh auth headers, refreshing token if needed."""
@@ -46,8 +107,22 @@ class EdgeCaseHandler:
         """
         try:
             # Try to get recording info
-            url = f"{self.base_url}/meetings/{meeting_uuid}/recordings"
-            response = requests.get(url, headers=self._get_headers(), timeout=30)
+            url = f"{self.base_url}/meetings/{encode_meeting_uuid(meeting_uuid)}/recordings"
+            
+            # Only the status matters, so use HEAD unless Zoom has rejected it
+            response = None
+            if self._head_supported is not False:
+                response = self.session.head(url, headers=self._get_headers(), timeout=30,
+                                             allow_redirects=True)
+                if response.status_code in (405, 501):
+                    logger.debug("HEAD not supported for recordings endpoint, using GET")
+                    self._head_supported = False
+                    response = None
+                else:
+                    self._head_supported = True
+            
+            if response is None:
+                response = self.session.get(url, headers=self._get_headers(), timeout=30)
             
             if response.status_code == 404:
                 # Recording not found, might be in trash
@@ -68,21 +143,15 @@ class EdgeCaseHandler:
     
     def handle_double_encoded_uuid(self, meeting_uuid: str) -> str:
         """
-        Handle double URL encoding for UUIDs containing forward slashes.
+        Encode a meeting UUID for an API path, double-encoding it where Zoom requires.
         
         Args:
             meeting_uuid: Original meeting UUID
             
         Returns:
-            Double-encoded UUID if needed
+            UUID ready for use in an API path (see encode_meeting_uuid)
         """
-        if "/" in meeting_uuid:
-            # Double URL encode UUIDs containing forward slashes
-            double_encoded = quote(quote(meeting_uuid, safe=""), safe="")
-            logger.debug(f"Double-encoded UUID: {meeting_uuid} -> {double_encoded}")
-            return double_encoded
-        
-        return meeting_uuid
+        return encode_meeting_uuid(meeting_uuid)
     
     def check_download_auth_methods(self, download_url: str, access_token: str) -> Tuple[str, str]:
         """
@@ -96,7 +165,7 @@ class EdgeCaseHandler:
             Tuple of (method, url) where method is 'header' or 'query_param'
         """
         # Check if URL already has query parameters
-        parsed_url = urlparse(download_url)
+        parsed_url = _cached_urlparse(download_url)
         
         if parsed_url.query:
             # URL has existing query params, use Authorization header
@@ -119,21 +188,18 @@ class EdgeCaseHandler:
         """
         try:
             # First, try with Authorization header
-            headers = self._get_headers().copy()
-            response = requests.head(download_url, headers=headers, timeout=30, allow_redirects=True)
+            response = self.session.head(download_url, headers=self._get_headers(), timeout=30,
+                                         allow_redirects=True)
             
             # Check if we get redirected to a passcode page
             final_url = response.url
-            if "passcode" in final_url.lower() or "auth" in final_url.lower():
+            # One lower() plus two C-level substring scans beats an IGNORECASE regex
+            final_url_lower = final_url.lower()
+            if "passcode" in final_url_lower or "auth" in final_url_lower:
                 logger.warning(f"Recording may require passcode: {final_url}")
                 
                 # Try with access_token as query parameter
-                if "?" in download_url:
-                    modified_url = f"{download_url}&access_token={access_token}"
-                else:
-                    modified_url = f"{download_url}?access_token={access_token}"
-                
-                return modified_url
+                return _append_access_token(download_url, access_token)
             
             return download_url
             
@@ -152,16 +218,25 @@ class EdgeCaseHandler:
             Tuple of (might_be_deleted, warning_message)
         """
         try:
+            # UTC ISO 8601 timestamps sort lexically, so recent recordings (the
+            # common case) can be cleared without parsing
+            if (len(meeting_start_time) == 20 and meeting_start_time[10] == 'T'
+                    and meeting_start_time[19] == 'Z'
+                    and meeting_start_time[:19] >= self._retention_cutoff_iso):
+                return False, None
+            
             # Parse meeting start time
             if meeting_start_time.endswith('Z'):
                 meeting_time = datetime.fromisoformat(meeting_start_time[:-1])
             else:
                 meeting_time = datetime.fromisoformat(meeting_start_time)
             
-            # Check if recording is older than 1 year (common retention period)
-            one_year_ago = datetime.utcnow() - timedelta(days=365)
+            # Other offsets are converted to naive UTC, like the cutoff
+            if meeting_time.tzinfo is not None:
+                meeting_time = meeting_time.astimezone(timezone.utc).replace(tzinfo=None)
             
-            if meeting_time < one_year_ago:
+            # Check if recording is older than 1 year (common retention period)
+            if meeting_time < self._retention_cutoff:
                 warning_msg = f"Recording from {meeting_time.strftime('%Y-%m-%d')} may be affected by retention policy"
                 logger.warning(warning_msg)
                 return True, warning_msg
@@ -195,19 +270,18 @@ class EdgeCaseHandler:
             logger.warning(f"File {file_info.get('id', 'unknown')} has zero size")
         
         # Check file status
-        status_raw = file_info.get("status", "")
-        status = str(status_raw).lower() if status_raw else ""
+        status = _normalize(file_info.get("status"))
         if status == "processing":
             return False, "File is still processing"
         
         # Validate download URL
+        # Only a non-empty scheme and host are required, so skip a full parse
         download_url = file_info.get("download_url")
-        try:
-            parsed_url = urlparse(download_url)
-            if not parsed_url.scheme or not parsed_url.netloc:
-                return False, f"Invalid download URL: {download_url}"
-        except Exception as e:
-            return False, f"Invalid download URL format: {e}"
+        if not isinstance(download_url, str):
+            return False, f"Invalid download URL format: {download_url!r}"
+        host_start = download_url.find("://") + 3
+        if host_start <= 3 or download_url[host_start:host_start + 1] in ("", "/", "?", "#"):
+            return False, f"Invalid download URL: {download_url}"
         
         return True, None
     
@@ -230,69 +304,57 @@ class EdgeCaseHandler:
         
         return 0
     
-    def check_account_restrictions(self, user_info: Dict) -> List[str]:
+    def check_account_restrictions(self, user_info: Dict) -> Iterator[str]:
         """
         Check for account-level restrictions that might affect downloads.
         
         Args:
             user_info: User information dictionary
             
-        Returns:
-            List of restriction warnings
+        Yields:
+            Restriction warnings
         """
-        warnings = []
-        
         # Check user type
-        user_type_raw = user_info.get("type", "")
-        user_type = str(user_type_raw).lower() if user_type_raw else ""
+        user_type = _normalize(user_info.get("type"))
         if user_type == "basic":
-            warnings.append("User has basic account type, may have recording limitations")
+            yield "User has basic account type, may have recording limitations"
         
         # Check user status
-        status_raw = user_info.get("status", "")
-        status = str(status_raw).lower() if status_raw else ""
+        status = _normalize(user_info.get("status"))
         if status != "active":
-            warnings.append(f"User status is '{status}', may affect recording access")
+            yield f"User status is '{status}', may affect recording access"
         
         # Check role
-        role_name_raw = user_info.get("role_name", "")
-        role_name = str(role_name_raw).lower() if role_name_raw else ""
+        role_name = _normalize(user_info.get("role_name"))
         if "admin" not in role_name and "owner" not in role_name:
-            warnings.append("User may not have admin privileges for downloading recordings")
-        
-        return warnings
+            yield "User may not have admin privileges for downloading recordings"
     
-    def handle_meeting_type_restrictions(self, meeting_info: Dict) -> List[str]:
+    def handle_meeting_type_restrictions(self, meeting_info: Dict) -> Iterator[str]:
         """
         Check for meeting type restrictions that might affect downloads.
         
         Args:
             meeting_info: Meeting information dictionary
             
-        Returns:
-            List of restriction warnings
+        Yields:
+            Restriction warnings
         """
-        warnings = []
-        
         # Check meeting type
-        meeting_type_raw = meeting_info.get("type", "")
-        meeting_type = str(meeting_type_raw).lower() if meeting_type_raw else ""
+        meeting_type = _normalize(meeting_info.get("type"))
         if meeting_type == "webinar":
-            warnings.append("Webinar recordings may have different access restrictions")
+            yield "Webinar recordings may have different access restrictions"
         
         # Check recording settings
         recording_count = meeting_info.get("recording_count", 0)
         if recording_count == 0:
-            warnings.append("No recordings found for this meeting")
+            yield "No recordings found for this meeting"
         
         # Check meeting duration
         duration = meeting_info.get("duration", 0)
         if duration < 1:
-            warnings.append("Meeting duration is very short, may not have recordings")
-        
-        return warnings
+            yield "Meeting duration is very short, may not have recordings"
     
-    def get_download_fallback_options(self, download_url: str, access_token: str) -> List[Dict]:
+    def get_download_fallback_options(self, download_url: str, access_token: str) -> Iterator[Dict]:
         """
         Get fallback options for download if primary method fails.
         
@@ -300,33 +362,25 @@ class EdgeCaseHandler:
             download_url: Original download URL
             access_token: OAuth access token
             
-        Returns:
-            List of fallback download options
+        Yields:
+            Fallback download options in order of preference (header mappings
+            are shared and must not be mutated)
         """
-        options = []
-        
         # Option 1: Authorization header (preferred)
-        options.append({
+        yield {
             "method": "header",
             "url": download_url,
             "headers": self._get_headers(),
             "description": "Authorization header method"
-        })
+        }
         
         # Option 2: Query parameter
-        if "?" in download_url:
-            fallback_url = f"{download_url}&access_token={access_token}"
-        else:
-            fallback_url = f"{download_url}?access_token={access_token}"
-        
-        options.append({
+        yield {
             "method": "query_param",
-            "url": fallback_url,
-            "headers": {"User-Agent": "Zoom-Extractor/1.0"},
+            "url": _append_access_token(download_url, access_token),
+            "headers": self._QUERY_PARAM_HEADERS,
             "description": "Query parameter method"
-        })
-        
-        return options
+        }
     
     def log_edge_case(self, case_type: str, details: Dict) -> None:
         """
@@ -336,11 +390,10 @@ class EdgeCaseHandler:
             case_type: Type of edge case
             details: Details about the edge case
         """
-        log_entry = {
-            "timestamp": datetime.utcnow().isoformat() + "Z",
-            "case_type": case_type,
-            "details": details
-        }
+        # Formatting details can be costly, so skip it when INFO is filtered
+        # out; the log formatter already records the timestamp
+        if not logger.isEnabledFor(logging.INFO):
+            return
         
         logger.info(f"Edge case detected: {case_type} - {details}")
         
@@ -6,10 +6,17 @@ Main script that orchestrates the entire extraction process.
 
 import os
 import sys
+import atexit
 import logging
+import logging.handlers
+import queue
 import click
-from typing import List, Optional, Dict, Iterator
-from datetime import datetime
+import itertools
+import requests
+from urllib3.util.retry import Retry
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Dict, Iterable, Iterator, Tuple, Union
+from datetime import datetime, timedelta
 from pathlib import Path
 from dotenv import load_dotenv
 
@@ -22,11 +29,26 @@ from .downloader import FileDownloader
 from .structure import DirectoryStructure
 from .state import ExtractionState, InventoryLogger
 from .edge_cases import EdgeCaseHandler
-from .rate_limiter import default_rate_limiter
+from .rate_limiter import default_rate_limiter, TokenBucket, TokenBucketAdapter
 
 # Load environment variables
 load_dotenv()
 
+# Background thread that writes log records for setup_logging
+_log_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def _stop_log_listener() -> None:
+    """Write out queued log records and stop the listener thread."""
+    global _log_listener
+    if _log_listener is not None:
+        _log_listener.stop()
+        _log_listener = None
+
+
+atexit.register(_stop_log_listener)
+
+
 # Configure logging
 def setup_logging(log_level: str, log_file: Optional[str] = None) -> None:
     """Setup logging configuration."""
@@ -57,11 +79,23 @@ def setup_logging(log_level: str, log_file: Optional[str] = None) -> None:
         file_handler.setFormatter(file_formatter)
         handlers.append(file_handler)
     
-    # Add handlers to root logger
+    # Records are only queued on the calling thread; formatting and the
+    # console/file writes happen on a listener thread, off the download path
+    global _log_listener
+    _stop_log_listener()
+    log_queue = queue.SimpleQueue()
+    _log_listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _log_listener.start()
+    
+    # The format doesn't use process or thread fields
+    logging.logProcesses = False
+    logging.logThreads = False
+    logging.logMultiprocessing = False
+    
+    # Add queue handler to root logger
     root_logger = logging.getLogger()
     root_logger.handlers.clear()
-    for handler in handlers:
-        root_logger.addHandler(handler)
+    root_logger.addHandler(logging.handlers.QueueHandler(log_queue))
 
 
 class ZoomExtractor:
@@ -70,7 +104,9 @@ class ZoomExtractor:
     def __init__(self, output_dir: str, user_filter: Optional[List[str]] = None,
                  from_date: Optional[str] = None, to_date: Optional[str] = None,
                  max_concurrent: int = 2, include_trash: bool = True,
-                 dry_run: bool = False):
+                 dry_run: bool = False, verify_hash: bool = True,
+                 use_cache: bool = True, cache_ttl: float = 86400,
+                 inventory_jsonl: bool = True):
         """
         Initialize Zoom extractor.
         
@@ -82,6 +118,10 @@ class ZoomExtractor:
             max_concurrent: Maximum concurrent downloads
             include_trash: Whether to include recordings in trash
             dry_run: If True, don't actually download files
+            verify_hash: If False, skip SHA-256 for files whose size matches
+            use_cache: Whether to cache listings of past date windows on disk
+            cache_ttl: Seconds a cached window listing stays valid
+            inventory_jsonl: Whether to write inventory.jsonl alongside inventory.db
         """
         self.output_dir = Path(output_dir)
         self.user_filter = user_filter
@@ -95,16 +135,35 @@ class ZoomExtractor:
         self.auth = get_auth_from_env()
         self.auth_headers = self.auth.get_auth_headers()
         
-        self.user_enumerator = UserEnumerator(self.auth_headers)
-        self.date_generator = DateWindowGenerator(from_date, to_date)
-        self.recordings_lister = RecordingsLister(self.auth_headers)
-        self.downloader = FileDownloader(self.auth_headers, max_concurrent)
+        # One pooled keep-alive session for the API components, sized for the
+        # concurrent window listing. Auth headers stay per request so token
+        # refreshes take effect. Every call takes a token from a shared bucket
+        # so the listing threads stay under Zoom's per-second limits. The
+        # adapter re-sends short-lived 429s itself (nothing above this session
+        # retries them); a daily-limit 429, whose Retry-After can be hours, is
+        # returned straight away. 429 stays out of the urllib3 forcelist
+        self.session = requests.Session()
+        self.token_bucket = TokenBucket(rate=10)
+        retry = Retry(total=3, backoff_factor=0.3, status_forcelist=(500, 502, 503, 504),
+                      raise_on_status=False)
+        self.session.mount("https://", TokenBucketAdapter(self.token_bucket, rate_limit_retries=3,
+                                                          pool_connections=16, pool_maxsize=64,
+                                                          max_retries=retry))
+        
         self.structure = DirectoryStructure(str(self.output_dir))
-        self.edge_handler = EdgeCaseHandler(self.auth_headers)
+        self.user_enumerator = UserEnumerator(self.auth_headers, session=self.session)
+        self.date_generator = DateWindowGenerator(from_date, to_date)
+        cache_dir = self.structure.meta_dir / "listing_cache" if use_cache else None
+        self.recordings_lister = RecordingsLister(self.auth_headers, session=self.session,
+                                                  cache_dir=cache_dir, cache_ttl=cache_ttl)
+        self.downloader = FileDownloader(self.auth_headers, max_concurrent, verify_hash=verify_hash,
+                                         meta_dir=self.structure.meta_dir / "downloads")
+        self.edge_handler = EdgeCaseHandler(self.auth_headers, session=self.session)
         
         # State management
         self.state = ExtractionState(self.structure.get_state_file_path())
-        self.inventory = InventoryLogger(self.structure.get_inventory_log_path())
+        self.inventory = InventoryLogger(self.structure.get_inventory_log_path(),
+                                         write_jsonl=inventory_jsonl)
         
         self.logger = logging.getLogger(__name__)
     
@@ -118,75 +177,59 @@ class ZoomExtractor:
         self.logger.info("Starting Zoom recordings extraction")
         
         try:
-            # Get all users (active + inactive + pending for comprehensive coverage)
-            active_users = list(self.user_enumerator.list_all_users(self.user_filter, user_type="active"))
-            inactive_users = list(self.user_enumerator.list_all_users(self.user_filter, user_type="inactive"))
-            pending_users = list(self.user_enumerator.list_all_users(self.user_filter, user_type="pending"))
-            
-            users = active_users + inactive_users + pending_users
-            self.logger.info(f"Found {len(active_users)} active, {len(inactive_users)} inactive, and {len(pending_users)} pending users ({len(users)} total)")
+            # Stream all users (active + inactive + pending for comprehensive
+            # coverage) so only the windows being listed are held in memory
+            users = self._iter_users()
             
-            if not users:
-                self.logger.warning("No users found to process")
-                return {"error": "No users found"}
+            # Totals grow as listings arrive instead of a separate counting
+            # pass, on top of the work earlier runs finished
+            self.state.carry_over_totals()
+            total_users = 0
+            processed_meetings = 0
             
-            # Set totals for progress tracking
-            total_meetings = 0
-            total_files = 0
+            window_labels = self._window_labels()
+            # Windows that ended over a day ago can't gain recordings, so they
+            # are marked done once processed and not listed again on resume
+            settled_before = datetime.utcnow() - timedelta(days=1)
             
-            # Count total meetings and files (for progress tracking)
-            for user in users:
-                user_id = user["id"]
-                user_email = user.get("email", "unknown")
+            window_listings = self._iter_window_listings(users)
+            for user_id, user_windows in itertools.groupby(window_listings, key=lambda item: item[0]["id"]):
+                total_users += 1
+                self.state.increment_totals(users=1)
+                user_processed = self.state.is_user_processed(user_id)
+                # Listed meetings and files not yet settled by a processed window
+                user_meetings = user_files = 0
                 
-                self.logger.info(f"Counting recordings for user: {user_email}")
-                
-                for start_date, end_date in self.date_generator.generate_monthly_windows():
-                    try:
-                        meetings = list(self.recordings_lister.list_user_recordings(
-                            user_id, start_date, end_date, self.include_trash
-                        ))
-                        total_meetings += len(meetings)
-                        
-                        for meeting in meetings:
-                            total_files += len(meeting.get("processed_files", []))
+                for user, start_date, end_date, meetings in user_windows:
+                    user_email = user.get("email", "unknown")
                     
-                    except Exception as e:
-                        self.logger.error(f"Failed to count recordings for {user_email}: {e}")
-            
-            self.state.set_totals(len(users), total_meetings, total_files)
-            
-            # Process each user and date window
-            processed_meetings = 0
-            processed_files = 0
-            
-            for user in users:
-                user_id = user["id"]
-                user_email = user.get("email", "unknown")
-                
-                # Skip if user already processed
-                if self.state.is_user_processed(user_id):
-                    self.logger.info(f"Skipping already processed user: {user_email}")
-                    continue
-                
-                self.logger.info(f"Processing user: {user_email}")
-                
-                for start_date, end_date in self.date_generator.generate_monthly_windows():
-                    window_key = f"{user_id}:{start_date.strftime('%Y-%m-%d')}:{end_date.strftime('%Y-%m-%d')}"
+                    window_meetings = window_files = 0
+                    if isinstance(meetings, Exception):
+                        self.logger.error(f"Failed to count recordings for {user_email}: {meetings}")
+                    else:
+                        window_meetings = len(meetings)
+                        window_files = sum(len(meeting.get("processed_files", [])) for meeting in meetings)
+                        self.state.increment_totals(meetings=window_meetings, files=window_files)
+                    
+                    # Skip if user already processed; its windows were not listed
+                    if user_processed:
+                        continue
+                    
+                    start_str, end_str = window_labels[start_date, end_date]
+                    window_key = f"{user_id}:{start_str}:{end_str}"
                     
                     # Skip if date window already processed
-                    if self.state.is_date_window_processed(user_id, 
-                                                          start_date.strftime('%Y-%m-%d'), 
-                                                          end_date.strftime('%Y-%m-%d')):
+                    if self.state.is_date_window_processed(user_id, start_str, end_str):
                         self.logger.info(f"Skipping already processed date window: {window_key}")
                         continue
                     
-                    self.logger.info(f"Processing date window: {start_date.strftime('%Y-%m-%d')} to {end_date.strftime('%Y-%m-%d')}")
+                    self.logger.info(f"Processing date window: {start_str} to {end_str}")
                     
                     try:
-                        meetings = self.recordings_lister.list_user_recordings(
-                            user_id, start_date, end_date, self.include_trash
-                        )
+                        if isinstance(meetings, Exception):
+                            raise meetings
+                        
+                        window_failed = False
                         
                         for meeting in meetings:
                             meeting_uuid = meeting.get("uuid")
@@ -199,10 +242,17 @@ class ZoomExtractor:
                             # Process meeting
                             result = self._process_meeting(user, meeting, (start_date, end_date))
                             processed_meetings += 1
+                            window_failed = window_failed or result.get("files_successful", 0) < result.get("files_processed", 0)
                             
                             # Update progress
                             if processed_meetings % 10 == 0:
                                 self._log_progress()
+                        
+                        # A dry run downloads nothing, so it must not mark work done
+                        if not window_failed and end_date < settled_before and not self.dry_run:
+                            self.state.mark_date_window_processed(user_id, start_str, end_str,
+                                                                  window_meetings, window_files)
+                            continue
                     
                     except Exception as e:
                         self.logger.error(f"Failed to process date window for {user_email}: {e}")
@@ -212,9 +262,21 @@ class ZoomExtractor:
                             "window": window_key,
                             "error": str(e)
                         })
+                    
+                    user_meetings += window_meetings
+                    user_files += window_files
                 
-                # Mark user as processed
-                self.state.mark_user_processed(user_id)
+                if user_processed:
+                    self.logger.info(f"Skipping already processed user: {user_email}")
+                elif not self.dry_run:
+                    # Mark user as processed
+                    self.state.mark_user_processed(user_id, user_meetings, user_files)
+            
+            if not total_users:
+                self.logger.warning("No users found to process")
+                return {"error": "No users found"}
+            
+            self.logger.info(f"Processed {total_users} users")
             
             # Final summary
             summary = self._generate_summary()
@@ -224,6 +286,68 @@ class ZoomExtractor:
         except Exception as e:
             self.logger.error(f"Extraction failed: {e}")
             return {"error": str(e)}
+        
+        finally:
+            self.state.close()
+            self.inventory.close()
+            self.downloader.close()
+            self.edge_handler.close()
+            self.session.close()
+    
+    def _window_labels(self) -> Dict[Tuple[datetime, datetime], Tuple[str, str]]:
+        """Format each date window's start and end once; every user shares the same windows."""
+        return {
+            (start_date, end_date): (start_date.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d'))
+            for start_date, end_date in self.date_generator.windows
+        }
+    
+    def _iter_users(self) -> Iterator[Dict]:
+        """
+        Stream active, then inactive, then pending users.
+        
+        The inactive and pending listings are independent of the active one,
+        so they are paged through in the background while active users
+        stream; user lists are small next to the recordings listed per user.
+        
+        Yields:
+            User dictionaries from the API
+        """
+        def list_users(user_type: str) -> List[Dict]:
+            return list(self.user_enumerator.list_all_users(self.user_filter, user_type=user_type))
+        
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            later = [executor.submit(list_users, user_type) for user_type in ("inactive", "pending")]
+            yield from self.user_enumerator.list_all_users(self.user_filter, user_type="active")
+            for future in later:
+                yield from future.result()
+    
+    def _iter_window_listings(self, users: Iterable[Dict]) -> Iterator[Tuple[Dict, datetime, datetime, Union[List[Dict], Exception]]]:
+        """
+        List recordings for every user and date window, in order.
+        
+        Each window is an independent, network-bound API call, so windows are
+        listed ahead on the recordings lister's bounded thread pool (see
+        RecordingsLister.iter_window_listings).
+        
+        Args:
+            users: User dictionaries to list recordings for
+            
+        Yields:
+            Tuples of (user, start_date, end_date, meetings), where meetings is
+            the exception raised if listing that window failed
+        """
+        window_labels = self._window_labels()
+        
+        # On resume, finished users and windows are passed through empty
+        # rather than listed again; the caller skips them anyway
+        def is_done(user: Dict, start_date: datetime, end_date: datetime) -> bool:
+            return (self.state.is_user_processed(user["id"])
+                    or self.state.is_date_window_processed(user["id"], *window_labels[start_date, end_date]))
+        
+        return self.recordings_lister.iter_window_listings(
+            users, self.date_generator.windows, self.include_trash,
+            lookahead=max(1, self.max_concurrent * 4), skip=is_done
+        )
     
     def _process_meeting(self, user: Dict, meeting: Dict, date_window: tuple) -> Dict:
         """
@@ -243,15 +367,11 @@ class ZoomExtractor:
         self.logger.info(f"Processing meeting: {meeting_topic} ({meeting_uuid})")
         
         # Check for edge cases
-        warnings = self.edge_handler.check_account_restrictions(user)
-        if warnings:
-            for warning in warnings:
-                self.logger.warning(f"Account restriction warning: {warning}")
+        for warning in self.edge_handler.check_account_restrictions(user):
+            self.logger.warning(f"Account restriction warning: {warning}")
         
-        meeting_warnings = self.edge_handler.handle_meeting_type_restrictions(meeting)
-        if meeting_warnings:
-            for warning in meeting_warnings:
-                self.logger.warning(f"Meeting restriction warning: {warning}")
+        for warning in self.edge_handler.handle_meeting_type_restrictions(meeting):
+            self.logger.warning(f"Meeting restriction warning: {warning}")
         
         # Process each file in the meeting
         file_results = []
@@ -261,13 +381,19 @@ class ZoomExtractor:
             self.logger.warning(f"No files to download for meeting: {meeting_topic}")
             return {"status": "no_files", "meeting": meeting_topic}
         
-        for file_info in processed_files:
+        # Drop files recorded as processed before touching the filesystem
+        is_file_processed = self.state.is_file_processed
+        pending_files = [file_info for file_info in processed_files
+                         if not is_file_processed(file_info.get("id"))]
+        if len(pending_files) < len(processed_files):
+            self.logger.info(f"Skipping {len(processed_files) - len(pending_files)} already processed files "
+                             f"for meeting: {meeting_topic}")
+        
+        downloads = {}
+        claimed_paths = {}
+        for file_info in pending_files:
             file_id = file_info.get("id")
-            
-            # Skip if file already processed
-            if self.state.is_file_processed(file_id):
-                self.logger.info(f"Skipping already processed file: {file_id}")
-                continue
+            expected_size = file_info.get("file_size")
             
             # Check if file already exists and is valid
             exists, file_path = self.structure.check_file_exists(user, meeting, file_info)
@@ -276,8 +402,9 @@ class ZoomExtractor:
                 file_results.append((True, {
                     "file_id": file_id,
                     "file_type": file_info.get("file_type"),
-                    "file_size": file_path.stat().st_size,
-                    "expected_size": file_info.get("file_size"),
+                    # check_file_exists only accepts a size-matched file
+                    "file_size": expected_size or file_path.stat().st_size,
+                    "expected_size": expected_size,
                     "sha256": None,  # Would need to calculate
                     "download_url": file_info.get("download_url"),
                     "status": "skipped"
@@ -285,58 +412,71 @@ class ZoomExtractor:
                 self.state.mark_file_processed(file_id, "skipped")
                 continue
             
-            # Download file
+            if file_path in claimed_paths:
+                # Two downloads into one path would share a .part file; the
+                # file counts as failed so the meeting is retried next run
+                self.logger.error(f"Not downloading file {file_id}: {file_path} is already claimed "
+                                  f"by file {claimed_paths[file_path].get('id')}")
+                file_results.append((False, {
+                    "file_id": file_id,
+                    "file_type": file_info.get("file_type"),
+                    "file_size": 0,
+                    "expected_size": expected_size,
+                    "sha256": None,
+                    "download_url": file_info.get("download_url"),
+                    "status": "failed",
+                    "error": f"Path collision with file {claimed_paths[file_path].get('id')}"
+                }))
+                continue
+            claimed_paths[file_path] = file_info
+            
             if not self.dry_run:
-                try:
-                    success, stats = self.downloader.download_file(
-                        file_info, file_path, self.auth.get_access_token()
-                    )
-                    file_results.append((success, stats))
-                    
-                    # Log to inventory
-                    self.inventory.log_file(user, meeting, file_info, file_path, (success, stats))
-                    
-                    # Update state
-                    status = "downloaded" if success else "failed"
-                    self.state.mark_file_processed(file_id, status)
-                    
-                    if success:
-                        self.logger.info(f"Downloaded: {file_path}")
-                    else:
-                        self.logger.error(f"Failed to download: {file_path}")
-                
-                except Exception as e:
-                    self.logger.error(f"Error downloading file {file_id}: {e}")
-                    file_results.append((False, {
-                        "file_id": file_id,
-                        "file_type": file_info.get("file_type"),
-                        "file_size": 0,
-                        "expected_size": file_info.get("file_size"),
-                        "sha256": None,
-                        "download_url": file_info.get("download_url"),
-                        "status": "error",
-                        "error": str(e)
-                    }))
-                    self.state.mark_file_processed(file_id, "failed")
+                downloads[file_path] = file_info
             else:
                 self.logger.info(f"[DRY RUN] Would download: {file_path}")
                 file_results.append((True, {
                     "file_id": file_id,
                     "file_type": file_info.get("file_type"),
-                    "file_size": file_info.get("file_size"),
-                    "expected_size": file_info.get("file_size"),
+                    "file_size": expected_size,
+                    "expected_size": expected_size,
                     "sha256": None,
                     "download_url": file_info.get("download_url"),
                     "status": "dry_run"
                 }))
         
+        # Download the meeting's files (video, audio, transcript, chat...) in
+        # parallel so the meeting takes as long as its largest file, not the sum
+        if downloads:
+            # Results arrive in completion order, each with the task it belongs to
+            results = self.downloader.iter_downloads_concurrent(
+                ((file_info, file_path) for file_path, file_info in downloads.items()),
+                self.auth.get_access_token())
+            
+            for file_info, file_path, success, stats in results:
+                file_id = file_info.get("id")
+                file_results.append((success, stats))
+                
+                # Log to inventory
+                self.inventory.log_file(user, meeting, file_info, file_path, (success, stats))
+                
+                # Update state
+                status = "downloaded" if success else "failed"
+                self.state.mark_file_processed(file_id, status)
+                
+                if success:
+                    self.logger.info(f"Downloaded: {file_path}")
+                elif stats.get("status") == "error":
+                    self.logger.error(f"Error downloading file {file_id}: {stats.get('error')}")
+                else:
+                    self.logger.error(f"Failed to download: {file_path}")
+        
         # Save meeting metadata
         if not self.dry_run:
-            self.structure.save_meeting_metadata(user, meeting, date_window, file_results)
-            self.structure.save_files_csv(user, meeting, file_results)
+            self.structure.persist_meeting_outputs(user, meeting, date_window, file_results)
         
-        # Mark meeting as processed
-        self.state.mark_meeting_processed(meeting_uuid)
+        # Mark meeting as processed; one with a failed file is retried next run
+        if not self.dry_run and all(success for success, _ in file_results):
+            self.state.mark_meeting_processed(meeting_uuid)
         
         return {
             "status": "completed",
@@ -349,7 +489,7 @@ class ZoomExtractor:
         """Log current progress."""
         summary = self.state.get_progress_summary()
         
-        self.logger.info(f"Progress: {summary['files']['downloaded'] + summary['files']['skipped']}/{summary['files']['total']} files processed "
+        self.logger.info(f"Progress: {summary['files']['downloaded'] + summary['files']['skipped']}/{summary['files']['total']} discovered files processed "
                         f"({summary['files']['progress_percent']:.1f}%)")
     
     def _generate_summary(self) -> Dict:
@@ -385,9 +525,21 @@ class ZoomExtractor:
               help='Log file path (optional)')
 @click.option('--resume', is_flag=True,
               help='Resume previous extraction')
+@click.option('--no-verify-hash', is_flag=True,
+              help='Skip SHA-256 for downloads whose size matches the API')
+@click.option('--no-cache', is_flag=True,
+              help='Always fetch recording listings instead of reusing cached past windows')
+@click.option('--cache-ttl',
+              default=86400,
+              type=float,
+              help='Seconds a cached window listing stays valid')
+@click.option('--no-inventory-jsonl', is_flag=True,
+              help='Record the inventory only in inventory.db, without inventory.jsonl')
 def main(output_dir: str, user_filter: Optional[str], from_date: Optional[str], 
          to_date: Optional[str], max_concurrent: int, include_trash: bool, 
-         dry_run: bool, log_level: str, log_file: Optional[str], resume: bool):
+         dry_run: bool, log_level: str, log_file: Optional[str], resume: bool,
+         no_verify_hash: bool, no_cache: bool, cache_ttl: float,
+         no_inventory_jsonl: bool):
     """
     Zoom Recordings Extractor
     
@@ -412,7 +564,11 @@ def main(output_dir: str, user_filter: Optional[str], from_date: Optional[str],
             to_date=to_date,
             max_concurrent=max_concurrent,
             include_trash=include_trash,
-            dry_run=dry_run
+            dry_run=dry_run,
+            verify_hash=not no_verify_hash,
+            use_cache=not no_cache,
+            cache_ttl=cache_ttl,
+            inventory_jsonl=not no_inventory_jsonl
         )
         
         # Show configuration
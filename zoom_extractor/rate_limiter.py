@@ -6,17 +6,32 @@ Handles rate limiting, exponential backoff, and retry logic for API calls.
 
 import time
 import logging
+import threading
 import requests
+from requests.adapters import HTTPAdapter
 from typing import Dict, Optional, Callable, Any
 from functools import wraps
+from email.utils import parsedate_to_datetime
 import random
 
 logger = logging.getLogger(__name__)
 
+# Responses worth retrying: rate limiting and transient server errors
+_RETRY_STATUSES = frozenset((429, 500, 502, 503, 504))
+
+# Transient network failures worth retrying
+_RETRY_EXCEPTIONS = (
+    requests.exceptions.ConnectionError,
+    requests.exceptions.Timeout,
+    requests.exceptions.ChunkedEncodingError
+)
+
 
 class RateLimiter:
     """Handles rate limiting with exponential backoff and jitter."""
     
+    _DELAY_TABLE_SIZE = 32
+    
     def __init__(self, base_delay: float = 1.0, max_delay: float = 60.0, 
                  backoff_factor: float = 2.0, jitter: bool = True):
         """
@@ -32,6 +47,16 @@ class RateLimiter:
         self.max_delay = max_delay
         self.backoff_factor = backoff_factor
         self.jitter = jitter
+        
+        # Un-jittered delay per attempt; attempts past the table reuse the last entry
+        self._delays = tuple(self._compute_delay(attempt) for attempt in range(self._DELAY_TABLE_SIZE))
+    
+    def _compute_delay(self, attempt: int) -> float:
+        """Exponential delay for an attempt, capped at max_delay."""
+        try:
+            return min(self.base_delay * (self.backoff_factor ** attempt), self.max_delay)
+        except OverflowError:
+            return self.max_delay
     
     def get_delay(self, attempt: int) -> float:
         """
@@ -43,8 +68,7 @@ class RateLimiter:
         Returns:
             Delay in seconds
         """
-        delay = self.base_delay * (self.backoff_factor ** attempt)
-        delay = min(delay, self.max_delay)
+        delay = self._delays[min(attempt, self._DELAY_TABLE_SIZE - 1)]
         
         if self.jitter:
             # Add ±25% jitter
@@ -62,23 +86,136 @@ class RateLimiter:
         """
         delay = self.get_delay(attempt)
         if delay > 0:
-            logger.debug(f"Rate limiting: sleeping for {delay:.2f} seconds (attempt {attempt + 1})")
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"Rate limiting: sleeping for {delay:.2f} seconds (attempt {attempt + 1})")
             time.sleep(delay)
 
 
+class TokenBucket:
+    """Thread-safe client-side token bucket that paces requests and backs off on 429s."""
+    
+    def __init__(self, rate: float = 10.0, capacity: Optional[float] = None):
+        """
+        Initialize token bucket.
+        
+        Args:
+            rate: Tokens added per second (sustained requests per second)
+            capacity: Maximum burst size (defaults to one second of tokens)
+        """
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self._tokens = self.capacity
+        self._last_refill = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+    
+    def _refill(self, now: float) -> None:
+        """Add the tokens accrued since the last refill (lock must be held)."""
+        self._tokens = min(self.capacity, self._tokens + (now - self._last_refill) * self.rate)
+        self._last_refill = now
+    
+    def acquire(self, timeout: Optional[float] = None) -> bool:
+        """
+        Block until a token is available and take it.
+        
+        Args:
+            timeout: Maximum seconds to wait (None waits indefinitely)
+            
+        Returns:
+            True if a token was taken, False if the timeout expired
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if now >= self._blocked_until and self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                wait = max(self._blocked_until - now, (1 - self._tokens) / self.rate)
+            
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                wait = min(wait, remaining)
+            time.sleep(wait)
+    
+    def penalize(self, retry_after: Optional[float] = None) -> None:
+        """
+        Record a 429 response: halve the available tokens and honour Retry-After.
+        
+        Args:
+            retry_after: Seconds the server asked us to wait, if given
+        """
+        with self._lock:
+            self._refill(time.monotonic())
+            if self._tokens > 0:
+                self._tokens /= 2
+            if retry_after and retry_after > 0:
+                self._blocked_until = max(self._blocked_until, time.monotonic() + retry_after)
+
+
+class TokenBucketAdapter(HTTPAdapter):
+    """HTTPAdapter that paces every request on a session through a shared TokenBucket."""
+    
+    def __init__(self, token_bucket: TokenBucket, max_pause: float = 60.0,
+                 rate_limit_retries: int = 3, **kwargs):
+        """
+        Initialize token bucket adapter.
+        
+        Args:
+            token_bucket: Bucket shared by every session this adapter is mounted on
+            max_pause: Longest Retry-After pause (seconds) applied to the bucket;
+                Zoom's daily-limit Retry-After can be hours and would stall every caller
+            rate_limit_retries: Times a 429 is re-sent after the pause; a Retry-After
+                longer than max_pause is returned to the caller straight away.
+                Pass 0 when a RetryHandler above the session retries 429s itself
+            **kwargs: Passed through to HTTPAdapter (pool sizes, max_retries)
+        """
+        self.token_bucket = token_bucket
+        self.max_pause = max_pause
+        self.rate_limit_retries = rate_limit_retries
+        super().__init__(**kwargs)
+    
+    def send(self, request, **kwargs):
+        attempt = 0
+        while True:
+            self.token_bucket.acquire()
+            response = super().send(request, **kwargs)
+            if response.status_code != 429:
+                return response
+            
+            retry_after = RetryHandler.get_retry_after(response)
+            daily_limit = bool(retry_after) and retry_after > self.max_pause
+            # Without a Retry-After, back off exponentially before the re-send
+            pause = min(retry_after, self.max_pause) if retry_after else min(2 ** attempt, self.max_pause)
+            logger.warning(f"Rate limited by {request.url.split('?', 1)[0]}, slowing down shared request pacing")
+            self.token_bucket.penalize(pause)
+            
+            if daily_limit or attempt >= self.rate_limit_retries:
+                return response
+            response.close()
+            attempt += 1
+
+
 class RetryHandler:
     """Handles retry logic for API calls with rate limiting."""
     
-    def __init__(self, max_retries: int = 5, rate_limiter: Optional[RateLimiter] = None):
+    def __init__(self, max_retries: int = 5, rate_limiter: Optional[RateLimiter] = None,
+                 token_bucket: Optional[TokenBucket] = None):
         """
         Initialize retry handler.
         
         Args:
             max_retries: Maximum number of retry attempts
             rate_limiter: Rate limiter instance (creates default if None)
+            token_bucket: Optional token bucket every attempt must take a token from
         """
         self.max_retries = max_retries
         self.rate_limiter = rate_limiter or RateLimiter()
+        self.token_bucket = token_bucket
     
     def should_retry(self, response: requests.Response, exception: Optional[Exception] = None) -> bool:
         """
@@ -91,25 +228,13 @@ class RetryHandler:
         Returns:
             True if request should be retried
         """
-        # Retry on network exceptions
         if exception is not None:
-            return isinstance(exception, (
-                requests.exceptions.ConnectionError,
-                requests.exceptions.Timeout,
-                requests.exceptions.RequestException
-            ))
-        
-        # Retry on specific HTTP status codes
-        if response.status_code in [429, 500, 502, 503, 504]:
-            return True
+            return isinstance(exception, _RETRY_EXCEPTIONS)
         
-        # Retry on rate limiting
-        if response.status_code == 429:
-            return True
-        
-        return False
+        return response.status_code in _RETRY_STATUSES
     
-    def get_retry_after(self, response: requests.Response) -> Optional[float]:
+    @staticmethod
+    def get_retry_after(response: requests.Response) -> Optional[float]:
         """
         Extract Retry-After header value.
         
@@ -122,14 +247,16 @@ class RetryHandler:
         retry_after = response.headers.get('Retry-After')
         if retry_after:
             try:
-                # Retry-After can be either seconds (int) or HTTP date
-                if retry_after.isdigit():
-                    return float(retry_after)
+                # Retry-After can be either seconds (int) or HTTP date; isdecimal
+                # alone would also accept non-ASCII digits
+                seconds = retry_after.strip()
+                if seconds.isascii() and seconds.isdecimal():
+                    return float(seconds)
                 else:
                     # Parse HTTP date (RFC 2822)
-                    from email.utils import parsedate_to_datetime
                     retry_time = parsedate_to_datetime(retry_after)
-                    return (retry_time.timestamp() - time.time())
+                    # A date already in the past means retry now
+                    return max(0.0, retry_time.timestamp() - time.time())
             except (ValueError, TypeError):
                 logger.warning(f"Invalid Retry-After header: {retry_after}")
         
@@ -150,35 +277,69 @@ class RetryHandler:
         Raises:
             Exception: If all retries are exhausted
         """
+        if self.token_bucket is not None:
+            self.token_bucket.acquire()
+        
+        # Fast path: nearly every call succeeds first time and never needs
+        # the retry bookkeeping below
+        try:
+            first_outcome = func(*args, **kwargs)
+        except requests.exceptions.RequestException as e:
+            first_outcome = e
+        else:
+            if not self.should_retry(first_outcome):
+                return first_outcome
+        
         last_exception = None
         
         for attempt in range(self.max_retries + 1):
             try:
-                response = func(*args, **kwargs)
+                if attempt:
+                    if self.token_bucket is not None:
+                        self.token_bucket.acquire()
+                    
+                    response = func(*args, **kwargs)
+                    
+                    # Check if we should retry
+                    if not self.should_retry(response):
+                        return response
+                elif isinstance(first_outcome, Exception):
+                    raise first_outcome  # Handled like any failed attempt below
+                else:
+                    response = first_outcome
                 
-                # Check if we should retry
-                if not self.should_retry(response):
-                    return response
+                # If this is the last attempt, raise the error
+                if attempt == self.max_retries:
+                    logger.error(f"Max retries ({self.max_retries}) exceeded")
+                    response.raise_for_status()
                 
                 # Check for rate limiting with Retry-After header
                 if response.status_code == 429:
                     retry_after = self.get_retry_after(response)
-                    if retry_after and retry_after > 0:
+                    if retry_after:
+                        # Don't let a daily-limit or malformed header sleep for hours
+                        retry_after = min(retry_after, self.rate_limiter.max_delay)
+                    if self.token_bucket is not None:
+                        # The bucket holds back every caller sharing it, not just this one
+                        self.token_bucket.penalize(retry_after)
+                        if retry_after and retry_after > 0:
+                            logger.warning(f"Rate limited, pausing requests for {retry_after:.2f} seconds as requested by server")
+                            continue
+                    elif retry_after and retry_after > 0:
                         logger.warning(f"Rate limited, waiting {retry_after:.2f} seconds as requested by server")
                         time.sleep(retry_after)
                         continue
                 
-                # If this is the last attempt, raise the error
-                if attempt == self.max_retries:
-                    logger.error(f"Max retries ({self.max_retries}) exceeded")
-                    response.raise_for_status()
-                
                 # Log retry attempt
                 logger.warning(f"Request failed with status {response.status_code}, retrying (attempt {attempt + 1}/{self.max_retries})")
                 
             except requests.exceptions.RequestException as e:
                 last_exception = e
                 
+                # Only transient network failures are worth another attempt
+                if not self.should_retry(None, e):
+                    raise
+                
                 # If this is the last attempt, raise the exception
                 if attempt == self.max_retries:
                     logger.error(f"Max retries ({self.max_retries}) exceeded, last error: {e}")
@@ -197,18 +358,20 @@ class RetryHandler:
         raise Exception("Unexpected retry logic error")
 
 
-def with_retry(max_retries: int = 5, rate_limiter: Optional[RateLimiter] = None):
+def with_retry(max_retries: int = 5, rate_limiter: Optional[RateLimiter] = None,
+               token_bucket: Optional[TokenBucket] = None):
     """
     Decorator for adding retry logic to functions.
     
     Args:
         max_retries: Maximum number of retry attempts
         rate_limiter: Rate limiter instance (creates default if None)
+        token_bucket: Optional token bucket shared by all calls
         
     Returns:
         Decorated function
     """
-    retry_handler = RetryHandler(max_retries, rate_limiter)
+    retry_handler = RetryHandler(max_retries, rate_limiter, token_bucket)
     
     def decorator(func):
         @wraps(func)
@@ -221,19 +384,49 @@ def with_retry(max_retries: int = 5, rate_limiter: Optional[RateLimiter] = None)
 class APIClient:
     """API client with built-in rate limiting and retry logic."""
     
-    def __init__(self, auth_headers: Dict[str, str], rate_limiter: Optional[RateLimiter] = None):
+    def __init__(self, auth_headers: Dict[str, str], rate_limiter: Optional[RateLimiter] = None,
+                 session: Optional[requests.Session] = None,
+                 token_bucket: Optional[TokenBucket] = None):
         """
         Initialize API client.
         
         Args:
             auth_headers: Authorization headers for requests
             rate_limiter: Rate limiter instance (creates default if None)
+            session: Optional requests.Session to share (one is created if omitted)
+            token_bucket: Optional bucket pacing every request on the session
+                this client creates; share one across clients for a global rate
         """
         self.auth_headers = auth_headers
         self.rate_limiter = rate_limiter or RateLimiter()
         self.retry_handler = RetryHandler(rate_limiter=self.rate_limiter)
+        
+        # Keep-alive session so calls reuse pooled connections; retries are
+        # handled here, so the adapter doesn't retry on its own (not even 429s)
+        self.token_bucket = token_bucket
+        self._owns_session = session is None
+        if session is None:
+            session = requests.Session()
+            if token_bucket is not None:
+                adapter = TokenBucketAdapter(token_bucket, rate_limit_retries=0, pool_connections=16,
+                                             pool_maxsize=64, max_retries=0)
+            else:
+                adapter = HTTPAdapter(pool_connections=16, pool_maxsize=64, max_retries=0)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+        self.session = session
+    
+    def close(self) -> None:
+        """Close the HTTP session if this client created it."""
+        if self._owns_session:
+            self.session.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
     
-    @with_retry(max_retries=5)
     def get(self, url: str, params: Optional[Dict] = None, timeout: int = 30) -> requests.Response:
         """
         Make GET request with retry logic.
@@ -246,9 +439,10 @@ class APIClient:
         Returns:
             HTTP response
         """
-        return requests.get(url, headers=self.auth_headers, params=params, timeout=timeout)
+        return self.retry_handler.retry_request(
+            self.session.get, url, headers=self.auth_headers, params=params, timeout=timeout
+        )
     
-    @with_retry(max_retries=5)
     def post(self, url: str, data: Optional[Dict] = None, json: Optional[Dict] = None, 
              timeout: int = 30) -> requests.Response:
         """
@@ -263,7 +457,28 @@ class APIClient:
         Returns:
             HTTP response
         """
-        return requests.post(url, headers=self.auth_headers, data=data, json=json, timeout=timeout)
+        return self.retry_handler.retry_request(
+            self.session.post, url, headers=self.auth_headers, data=data, json=json, timeout=timeout
+        )
+    
+    def _honor_retry_after(self, response: requests.Response) -> bool:
+        """
+        Sleep for the response's Retry-After, capped at the rate limiter's max delay.
+        
+        Args:
+            response: HTTP response that asked us to back off
+            
+        Returns:
+            True if a Retry-After was honoured, False if the caller should back off itself
+        """
+        retry_after = RetryHandler.get_retry_after(response)
+        if not retry_after:
+            return False
+        
+        retry_after = min(retry_after, self.rate_limiter.max_delay)
+        logger.warning(f"Waiting {retry_after:.2f} seconds as requested by server")
+        time.sleep(retry_after)
+        return True
     
     def download_with_retry(self, url: str, stream: bool = True, timeout: int = 300) -> requests.Response:
         """
@@ -281,13 +496,15 @@ class APIClient:
         
         for attempt in range(5):  # Max 5 retries for downloads
             try:
-                response = requests.get(url, headers=self.auth_headers, stream=stream, timeout=timeout)
+                response = self.session.get(url, headers=self.auth_headers, stream=stream, timeout=timeout)
                 
                 # For downloads, we might want to retry on certain status codes
-                if response.status_code in [429, 500, 502, 503, 504]:
+                if response.status_code in _RETRY_STATUSES:
                     if attempt < 4:  # Don't retry on last attempt
                         logger.warning(f"Download failed with status {response.status_code}, retrying (attempt {attempt + 1}/5)")
-                        self.rate_limiter.sleep(attempt)
+                        response.close()  # Return the streamed connection to the pool
+                        if response.status_code not in (429, 503) or not self._honor_retry_after(response):
+                            self.rate_limiter.sleep(attempt)
                         continue
                 
                 return response
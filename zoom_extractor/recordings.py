@@ -4,29 +4,98 @@ Recordings Listing Module
 Handles listing recordings per user and date window with pagination support.
 """
 
+import os
+import time
+import hashlib
 import logging
 import requests
-from typing import List, Dict, Optional, Iterator, Tuple
-from datetime import datetime
-from urllib.parse import quote
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+from typing import List, Dict, Optional, Callable, Iterable, Iterator, Sequence, Tuple, Union
+from datetime import datetime, timedelta
+from functools import lru_cache
+from pathlib import Path
+from types import MappingProxyType
+from urllib.parse import quote, urlencode
+
+from . import json_compat
 
 logger = logging.getLogger(__name__)
 
+# Extension for each file type when the API doesn't provide one
+_EXTENSION_MAP = MappingProxyType({
+    "mp4": "mp4",
+    "m4a": "m4a",
+    "timeline": "json",
+    "transcript": "vtt",
+    "chat": "txt",
+    "cc": "vtt",
+    "audio_transcript": "vtt"
+})
+
+
+@lru_cache(maxsize=4096)
+def encode_meeting_uuid(meeting_uuid: str) -> str:
+    """
+    URL-encode a meeting UUID for use in an API path.
+    
+    Zoom requires double encoding only when the UUID begins with "/" or
+    contains "//"; every other UUID is encoded once.
+    """
+    encoded = quote(meeting_uuid, safe="")
+    if meeting_uuid.startswith("/") or "//" in meeting_uuid:
+        return quote(encoded, safe="")
+    return encoded
+
+
+def _normalize(value) -> str:
+    """Lower-case an API field; missing values become ''."""
+    if not value:
+        return ""
+    if isinstance(value, str):
+        return value.lower()
+    return str(value).lower()
+
 
 class RecordingsLister:
     """Handles listing of Zoom recordings with pagination and filtering."""
     
-    def __init__(self, auth_headers: Dict[str, str], auth=None):
+    # Zoom caps recordings pages at 300; the old fixed size is the fallback floor
+    _MAX_PAGE_SIZE = 300
+    _MIN_PAGE_SIZE = 30
+    
+    def __init__(self, auth_headers: Dict[str, str], auth=None,
+                 session: Optional[requests.Session] = None,
+                 cache_dir: Optional[str] = None, cache_ttl: float = 86400):
         """
         Initialize recordings lister.
         
         Args:
             auth_headers: Authorization headers for API requests
             auth: Optional ZoomAuth instance for automatic token refresh
+            session: Optional requests.Session to share (one is created if omitted)
+            cache_dir: Directory for cached listings of past windows (disabled if None)
+            cache_ttl: Seconds a cached window listing stays valid
         """
         self.auth_headers = auth_headers
         self.auth = auth
         self.base_url = "https://api.zoom.us/v2"
+        self.page_size = self._MAX_PAGE_SIZE  # Lowered if the account rejects it
+        
+        # Keep-alive session so paginated calls reuse one TLS connection
+        self._owns_session = session is None
+        self.session = session if session is not None else requests.Session()
+        
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        self.cache_ttl = cache_ttl
+        if self.cache_dir:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            self._prune_cache()
+    
+    def close(self) -> None:
+        """Close the HTTP session if this lister created it."""
+        if self._owns_session:
+            self.session.close()
     
     def _get_headers(self) -> Dict[str, str]:
         """Get fresh auth headers, refreshing token if needed."""
@@ -34,6 +103,48 @@ class RecordingsLister:
             return self.auth.get_auth_headers()
         return self.auth_headers
     
+    def _prune_cache(self) -> None:
+        """Delete cached window listings that have expired, and leftover temp files."""
+        cutoff = time.time() - self.cache_ttl
+        for entry in os.scandir(self.cache_dir):
+            try:
+                if entry.name.endswith('.tmp') or entry.stat().st_mtime < cutoff:
+                    os.unlink(entry.path)
+            except OSError as e:
+                logger.debug(f"Failed to prune cache entry {entry.path}: {e}")
+    
+    def _get_cache_path(self, window_key: str) -> Path:
+        """Get the cache file for a listing window key."""
+        return self.cache_dir / f"{hashlib.blake2b(window_key.encode(), digest_size=16).hexdigest()}.json"
+    
+    def _load_cached_window(self, window_key: str) -> Optional[List[Dict]]:
+        """
+        Load a window's cached meetings if they are still fresh.
+        
+        Args:
+            window_key: Key naming the user, date range and trash type
+            
+        Returns:
+            Raw meetings from every page of the window, or None on a miss
+        """
+        cache_path = self._get_cache_path(window_key)
+        try:
+            if time.time() - cache_path.stat().st_mtime > self.cache_ttl:
+                return None
+            return json_compat.loads(cache_path.read_bytes())["meetings"]
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+    
+    def _save_cached_window(self, window_key: str, meetings: List[Dict]) -> None:
+        """Store the raw meetings of a fully listed window in the cache."""
+        cache_path = self._get_cache_path(window_key)
+        tmp_path = cache_path.with_suffix('.tmp')
+        try:
+            tmp_path.write_bytes(json_compat.dumps({"meetings": meetings}))
+            os.replace(tmp_path, cache_path)
+        except OSError as e:
+            logger.warning(f"Failed to cache window listing: {e}")
+    
     def list_user_recordings(self, user_id: str, start_date: datetime, end_date: datetime,
                            include_trash: bool = False) -> Iterator[Dict]:
         """
@@ -52,30 +163,64 @@ class RecordingsLister:
         from_date = start_date.strftime('%Y-%m-%d')
         to_date = end_date.strftime('%Y-%m-%d')
         
-        url = f"{self.base_url}/users/{user_id}/recordings"
-        params = {
-            "from": from_date,
-            "to": to_date,
-            "page_size": 30  # Reduced page size for better compatibility
-        }
+        def listing_url(page_size: int) -> str:
+            params = [
+                ("from", from_date),
+                ("to", to_date),
+                ("page_size", page_size)
+            ]
+            if include_trash:
+                params.append(("trash_type", "meeting_recordings"))
+            return f"{self.base_url}/users/{user_id}/recordings?{urlencode(params)}"
         
-        if include_trash:
-            params["trash_type"] = "meeting_recordings"
+        # The query only changes by the page token, so encode the rest once
+        page_size = self.page_size
+        url = listing_url(page_size)
         
+        # Past windows don't change, so they can be served from cache. Page
+        # tokens expire, so only a window listed through to its last page is
+        # cached, as a whole
+        cacheable = self.cache_dir is not None and end_date < datetime.utcnow() - timedelta(days=1)
+        if cacheable:
+            window_key = f"{user_id}|{from_date}|{to_date}|{'meeting_recordings' if include_trash else ''}"
+            cached_meetings = self._load_cached_window(window_key)
+            if cached_meetings is not None:
+                for meeting in cached_meetings:
+                    processed_meeting = self._process_meeting_recordings(meeting, user_id)
+                    if processed_meeting:
+                        yield processed_meeting
+                return
+            window_meetings = []
+        
+        debug_enabled = logger.isEnabledFor(logging.DEBUG)
         next_page_token = None
         
         while True:
+            page_url = url
             if next_page_token:
-                params["next_page_token"] = next_page_token
+                page_url = f"{url}&next_page_token={quote(next_page_token, safe='')}"
             
-            logger.debug(f"Fetching recordings for user {user_id} from {from_date} to {to_date}, page token: {next_page_token}")
+            if debug_enabled:
+                logger.debug(f"Fetching recordings for user {user_id} from {from_date} to {to_date}, page token: {next_page_token}")
             
             try:
-                response = requests.get(url, headers=self._get_headers(), params=params, timeout=30)
+                response = self.session.get(page_url, headers=self._get_headers(), timeout=30)
+                
+                # Some accounts reject large pages; halve and start over
+                if (response.status_code == 400 and not next_page_token
+                        and page_size > self._MIN_PAGE_SIZE and b"page_size" in response.content.lower()):
+                    page_size = max(self._MIN_PAGE_SIZE, page_size // 2)
+                    self.page_size = page_size
+                    logger.warning(f"page_size rejected, retrying recordings listing with page_size={page_size}")
+                    url = listing_url(page_size)
+                    continue
+                
                 response.raise_for_status()
                 
-                data = response.json()
+                data = json_compat.loads(response.content)
                 meetings = data.get("meetings", [])
+                if cacheable:
+                    window_meetings.extend(meetings)
                 
                 for meeting in meetings:
                     # Process recording files for each meeting
@@ -86,11 +231,15 @@ class RecordingsLister:
                 # Check for next page
                 next_page_token = data.get("next_page_token")
                 if not next_page_token:
+                    if cacheable:
+                        self._save_cached_window(window_key, window_meetings)
                     break
                     
-                logger.debug(f"Found {len(meetings)} meetings, continuing to next page")
+                if debug_enabled:
+                    logger.debug(f"Found {len(meetings)} meetings, continuing to next page")
                 
-            except requests.exceptions.RequestException as e:
+            except (requests.exceptions.RequestException, ValueError) as e:
+                # ValueError covers a malformed JSON body
                 logger.error(f"Failed to fetch recordings for user {user_id}: {e}")
                 raise
     
@@ -108,18 +257,18 @@ class RecordingsLister:
         recording_files = meeting.get("recording_files", [])
         
         if not recording_files:
-            logger.debug(f"No recording files found for meeting {meeting.get('uuid', 'unknown')}")
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"No recording files found for meeting {meeting.get('uuid', 'unknown')}")
             return None
         
         # Filter and categorize recording files
-        processed_files = []
-        for file_info in recording_files:
-            processed_file = self._process_recording_file(file_info)
-            if processed_file:
-                processed_files.append(processed_file)
+        processed_files = [processed_file
+                           for processed_file in map(self._process_recording_file, recording_files)
+                           if processed_file is not None]
         
         if not processed_files:
-            logger.debug(f"No valid recording files found for meeting {meeting.get('uuid', 'unknown')}")
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"No valid recording files found for meeting {meeting.get('uuid', 'unknown')}")
             return None
         
         # Add processed files to meeting data
@@ -129,7 +278,8 @@ class RecordingsLister:
         
         return meeting
     
-    def _process_recording_file(self, file_info: Dict) -> Optional[Dict]:
+    @staticmethod
+    def _process_recording_file(file_info: Dict) -> Optional[Dict]:
         """
         Process individual recording file information.
         
@@ -140,22 +290,12 @@ class RecordingsLister:
             Processed file information or None if invalid
         """
         # Extract file type and determine extension
-        file_type_raw = file_info.get("file_type", "")
-        file_type = str(file_type_raw).lower() if file_type_raw else ""
+        file_type = _normalize(file_info.get("file_type"))
         file_extension = file_info.get("file_extension", "")
         
         # Map file types to extensions if not provided
         if not file_extension:
-            extension_map = {
-                "mp4": "mp4",
-                "m4a": "m4a", 
-                "timeline": "json",
-                "transcript": "vtt",
-                "chat": "txt",
-                "cc": "vtt",
-                "audio_transcript": "vtt"
-            }
-            file_extension = extension_map.get(file_type, "unknown")
+            file_extension = _EXTENSION_MAP.get(file_type, "unknown")
         
         # Skip files without download URLs
         download_url = file_info.get("download_url")
@@ -164,10 +304,10 @@ class RecordingsLister:
             return None
         
         # Skip files that are not ready for download
-        status_raw = file_info.get("status", "")
-        status = str(status_raw).lower() if status_raw else ""
+        status = _normalize(file_info.get("status"))
         if status == "processing":
-            logger.debug(f"File {file_info.get('id', 'unknown')} is still processing")
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"File {file_info.get('id', 'unknown')} is still processing")
             return None
         
         processed_file = {
@@ -194,56 +334,106 @@ class RecordingsLister:
         Returns:
             Meeting with recordings or None if not found
         """
-        # Double URL encode the UUID if it contains forward slashes
-        if "/" in meeting_uuid:
-            encoded_uuid = quote(quote(meeting_uuid, safe=""), safe="")
-        else:
-            encoded_uuid = quote(meeting_uuid, safe="")
-        
-        url = f"{self.base_url}/meetings/{encoded_uuid}/recordings"
+        url = f"{self.base_url}/meetings/{encode_meeting_uuid(meeting_uuid)}/recordings"
         
         try:
-            response = requests.get(url, headers=self._get_headers(), timeout=30)
+            response = self.session.get(url, headers=self._get_headers(), timeout=30)
             response.raise_for_status()
             
-            meeting = response.json()
+            meeting = json_compat.loads(response.content)
             
             # Process the meeting's recording files
             processed_meeting = self._process_meeting_recordings(meeting, meeting.get("host_id", "unknown"))
             return processed_meeting
             
-        except requests.exceptions.RequestException as e:
+        except (requests.exceptions.RequestException, ValueError) as e:
             logger.warning(f"Failed to get recordings for meeting {meeting_uuid}: {e}")
             return None
     
-    def list_all_recordings(self, users: Iterator[Dict], date_windows: Iterator[Tuple[datetime, datetime]],
-                          include_trash: bool = False) -> Iterator[Tuple[Dict, Dict, Tuple[datetime, datetime]]]:
+    def iter_window_listings(self, users: Iterable[Dict], date_windows: Sequence[Tuple[datetime, datetime]],
+                             include_trash: bool = False, lookahead: int = 8,
+                             skip: Optional[Callable[[Dict, datetime, datetime], bool]] = None
+                             ) -> Iterator[Tuple[Dict, datetime, datetime, Union[List[Dict], Exception]]]:
+        """
+        List recordings for every user and date window, in order.
+        
+        Each window is an independent, network-bound API call, so windows are
+        listed ahead on a thread pool. Only lookahead listings are in flight,
+        which keeps memory proportional to that bound rather than to the
+        whole account.
+        
+        Args:
+            users: Iterable of user dictionaries, consumed lazily
+            date_windows: Sequence of (start_date, end_date) tuples, reused for every user
+            include_trash: Whether to include recordings in trash
+            lookahead: Maximum number of windows listed ahead of the caller
+            skip: Optional predicate on (user, start_date, end_date); matching
+                windows are not listed and are yielded with no meetings
+            
+        Yields:
+            Tuples of (user, start_date, end_date, meetings), where meetings is
+            the exception raised if listing that window failed
+        """
+        pending = deque()
+        
+        def list_window(user_id: str, start_date: datetime, end_date: datetime) -> List[Dict]:
+            return list(self.list_user_recordings(user_id, start_date, end_date, include_trash))
+        
+        def result(item: Tuple) -> Tuple[Dict, datetime, datetime, Union[List[Dict], Exception]]:
+            user, start_date, end_date, future = item
+            if future is None:
+                return user, start_date, end_date, []
+            try:
+                return user, start_date, end_date, future.result()
+            except Exception as e:
+                return user, start_date, end_date, e
+        
+        with ThreadPoolExecutor(max_workers=lookahead) as executor:
+            for user in users:
+                listing = False
+                for start_date, end_date in date_windows:
+                    if skip is not None and skip(user, start_date, end_date):
+                        future = None
+                    else:
+                        if not listing:
+                            logger.info(f"Listing recordings for user: {user.get('email', 'unknown')} ({user['id']})")
+                            listing = True
+                        future = executor.submit(list_window, user["id"], start_date, end_date)
+                    pending.append((user, start_date, end_date, future))
+                    if len(pending) >= lookahead:
+                        yield result(pending.popleft())
+            
+            while pending:
+                yield result(pending.popleft())
+    
+    def list_all_recordings(self, users: Iterable[Dict], date_windows: Sequence[Tuple[datetime, datetime]],
+                          include_trash: bool = False,
+                          max_workers: int = 8) -> Iterator[Tuple[Dict, Dict, Tuple[datetime, datetime]]]:
         """
         List all recordings across all users and date windows.
         
+        Windows are listed ahead on a thread pool by iter_window_listings,
+        max_workers at a time, and meetings are yielded user by user, window
+        by window.
+        
         Args:
-            users: Iterator of user dictionaries
-            date_windows: Iterator of (start_date, end_date) tuples
+            users: Iterable of user dictionaries, consumed lazily
+            date_windows: Sequence of (start_date, end_date) tuples, reused for every
+                user (an iterator is materialized once)
             include_trash: Whether to include recordings in trash
+            max_workers: Maximum number of windows listed concurrently
             
         Yields:
             Tuples of (user, meeting, date_window)
         """
-        users_list = list(users)  # Convert to list to avoid iterator exhaustion
+        # Reused for every user, not just the first
+        date_windows = tuple(date_windows)
         
-        for user in users_list:
-            user_id = user["id"]
-            user_email = user.get("email", "unknown")
+        for user, start_date, end_date, meetings in self.iter_window_listings(users, date_windows, include_trash,
+                                                                              lookahead=max_workers):
+            if isinstance(meetings, Exception):
+                logger.error(f"Failed to process recordings for user {user.get('email', 'unknown')} in window {start_date.strftime('%Y-%m-%d')} to {end_date.strftime('%Y-%m-%d')}: {meetings}")
+                continue
             
-            logger.info(f"Processing user: {user_email} ({user_id})")
-            
-            for start_date, end_date in date_windows:
-                logger.info(f"Processing date window: {start_date.strftime('%Y-%m-%d')} to {end_date.strftime('%Y-%m-%d')}")
-                
-                try:
-                    for meeting in self.list_user_recordings(user_id, start_date, end_date, include_trash):
-                        yield (user, meeting, (start_date, end_date))
-                        
-                except Exception as e:
-                    logger.error(f"Failed to process recordings for user {user_email} in window {start_date.strftime('%Y-%m-%d')} to {end_date.strftime('%Y-%m-%d')}: {e}")
-                    continue
+            for meeting in meetings:
+                yield (user, meeting, (start_date, end_date))
@@ -4,48 +4,177 @@ State Management and Inventory Logging Module
 Handles extraction state persistence and inventory logging for resumable operations.
 """
 
-import json
+import atexit
 import logging
+import os
+import queue
+import shutil
 import sqlite3
+import time
 from typing import Dict, List, Optional, Set, Tuple
 from pathlib import Path
 from datetime import datetime
 import threading
+from collections import deque
+
+from . import json_compat
 
 logger = logging.getLogger(__name__)
 
+# Read buffer for replaying the journal and the files log
+_READ_BUFFER = 1 << 20
+
+
+def _utcnow_z() -> str:
+    """Current UTC time as an ISO 8601 string with a Z suffix."""
+    now = time.time()
+    return f"{time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(now))}.{int(now % 1 * 1e6):06d}Z"
+
+
+_INVENTORY_INSERT = '''
+    INSERT OR REPLACE INTO inventory (
+        timestamp, user_id, user_email, meeting_id, meeting_uuid,
+        meeting_topic, meeting_start_time, file_id, file_type,
+        file_extension, file_size, expected_size, sha256,
+        file_path, download_url, status, error_message
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+# File count, success count, failure count and total bytes; the
+# COALESCEs turn an empty match into zeros
+_INVENTORY_TOTALS = '''
+    COUNT(*),
+    COALESCE(SUM(status = 'success'), 0),
+    COALESCE(SUM(status = 'failed'), 0),
+    COALESCE(SUM(file_size), 0)
+'''
+
 
 class ExtractionState:
     """Manages extraction state for resumable operations."""
     
-    def __init__(self, state_file: Path):
+    _FILE_RECORD_TAIL = 1000
+    
+    def __init__(self, state_file: Path, flush_interval: float = 0.5,
+                 max_pending: int = 100, compact_threshold: int = 10000):
         """
         Initialize extraction state manager.
         
+        Progress marks are appended to a journal next to the state file
+        rather than rewriting it. The journal is flushed at most once per
+        flush_interval, or as soon as max_pending marks are waiting, and
+        folded back into the state file once it holds compact_threshold
+        events or the state is closed.
+        
+        File records are spilled to a sidecar log when the state file is
+        saved; only the most recent ones are kept in memory and in the
+        state file, while every processed id stays indexed.
+        
         Args:
             state_file: Path to state file
+            flush_interval: Seconds to coalesce progress marks before flushing
+            max_pending: Number of unflushed marks that forces an immediate flush
+            compact_threshold: Journal length that triggers a state file rewrite
         """
         self.state_file = state_file
         self.state_file.parent.mkdir(parents=True, exist_ok=True)
+        self.journal_file = state_file.with_suffix('.jsonl')
+        self.files_log = state_file.with_name(f"{state_file.stem}_files.jsonl")
         self._lock = threading.Lock()
+        
+        self._flush_interval = flush_interval
+        self._max_pending = max_pending
+        self._compact_threshold = compact_threshold
+        self._pending = 0
+        self._flush_timer: Optional[threading.Timer] = None
+        self._journal_handle = None
+        self._journal_entries = 0
+        
+        self._backup_state()
         self._state = self._load_state()
+        self._build_indexes()
+        self._replay_journal()
+        if self.journal_file.exists():
+            # Start from a fresh journal so new events never follow a torn line
+            self._save_state()
+        atexit.register(self.close)
+    
+    def _backup_state(self) -> None:
+        """Copy the state file as it was when this run started to .bak."""
+        try:
+            if self.state_file.exists():
+                shutil.copyfile(self.state_file, self.state_file.with_suffix('.bak'))
+        except IOError as e:
+            logger.warning(f"Failed to back up state file: {e}")
+    
+    def _build_indexes(self) -> None:
+        """Index the processed lists so membership checks don't scan them."""
+        progress = self._state["progress"]
+        self._processed_users = set(progress["users_processed"])
+        self._processed_windows = set(progress["date_windows_processed"])
+        self._processed_meetings = set(progress["meetings_processed"])
+        
+        records = progress["files_processed"]
+        self._processed_file_ids = self._read_files_log() if progress.get("files_spilled") else set()
+        self._processed_file_ids.update(record["file_id"] for record in records)
+        # A state file from before the files log carries every record;
+        # they all move to the log on the next save
+        self._unspilled: List[Dict] = [] if progress.get("files_spilled") else list(records)
+        progress["files_processed"] = deque(records, maxlen=self._FILE_RECORD_TAIL)
+    
+    def _read_files_log(self) -> Set[str]:
+        """Collect the processed file ids recorded in the files log."""
+        loads = json_compat.loads
+        try:
+            if not self.files_log.exists():
+                return set()
+            
+            # Fast path: one pass straight into the set
+            with open(self.files_log, 'rb', buffering=_READ_BUFFER) as f:
+                try:
+                    return {loads(line)["file_id"] for line in f}
+                except ValueError:
+                    pass
+            
+            # A torn line from an interrupted run; keep only the good lines
+            # and rewrite the log so later appends don't land on the tear
+            file_ids = set()
+            good_lines = []
+            with open(self.files_log, 'rb', buffering=_READ_BUFFER) as f:
+                for line in f:
+                    try:
+                        file_ids.add(loads(line)["file_id"])
+                    except ValueError:
+                        logger.warning(f"Ignoring truncated entry in {self.files_log}")
+                        continue
+                    good_lines.append(line)
+            tmp_file = self.files_log.with_suffix('.jsonl.tmp')
+            with open(tmp_file, 'wb') as f:
+                f.write(b''.join(good_lines))
+            os.replace(tmp_file, self.files_log)
+            return file_ids
+        
+        except IOError as e:
+            logger.warning(f"Failed to read files log: {e}")
+            return set()
     
     def _load_state(self) -> Dict:
         """Load state from file."""
         try:
             if self.state_file.exists():
-                with open(self.state_file, 'r') as f:
-                    state = json.load(f)
+                state = json_compat.loads(self.state_file.read_bytes())
                 logger.debug(f"Loaded extraction state from {self.state_file}")
                 return state
-        except (json.JSONDecodeError, IOError) as e:
+        except (ValueError, IOError) as e:
+            # ValueError covers a malformed JSON body
             logger.warning(f"Failed to load state file: {e}")
         
         # Return default state
+        now = datetime.utcnow()
         return {
-            "extraction_id": datetime.utcnow().strftime("%Y%m%d_%H%M%S"),
-            "start_time": datetime.utcnow().isoformat() + "Z",
-            "last_update": datetime.utcnow().isoformat() + "Z",
+            "extraction_id": now.strftime("%Y%m%d_%H%M%S"),
+            "start_time": now.strftime("%Y-%m-%dT%H:%M:%S.%fZ"),
+            "last_update": now.strftime("%Y-%m-%dT%H:%M:%S.%fZ"),
             "settings": {},
             "progress": {
                 "users_processed": [],
@@ -55,6 +184,10 @@ class ExtractionState:
                 "total_users": 0,
                 "total_meetings": 0,
                 "total_files": 0,
+                # Meetings and files in work finished by earlier runs, which a
+                # resumed run skips instead of listing again
+                "settled_meetings": 0,
+                "settled_files": 0,
                 "files_downloaded": 0,
                 "files_skipped": 0,
                 "files_failed": 0
@@ -62,28 +195,185 @@ class ExtractionState:
             "errors": []
         }
     
+    def _replay_journal(self) -> None:
+        """Apply journal events recorded after the state file was last saved."""
+        applied = self._state.get("journal_seq", 0)
+        replayed = 0
+        try:
+            if self.journal_file.exists():
+                loads = json_compat.loads
+                with open(self.journal_file, 'rb', buffering=_READ_BUFFER) as f:
+                    for line in f:
+                        try:
+                            event = loads(line)
+                        except ValueError:
+                            # Only the last line can be torn by an interrupted run
+                            logger.warning(f"Ignoring truncated entry in {self.journal_file}")
+                            break
+                        # Events at or below journal_seq are already in the state file
+                        if event["n"] > applied:
+                            self._apply_event(event)
+                            applied = event["n"]
+                            replayed += 1
+        except IOError as e:
+            logger.warning(f"Failed to read state journal: {e}")
+        
+        self._state["journal_seq"] = applied
+        self._journal_entries = replayed
+        if replayed:
+            logger.debug(f"Replayed {replayed} events from {self.journal_file}")
+    
+    def _apply_event(self, event: Dict) -> None:
+        """Apply a single progress event to the in-memory state."""
+        progress = self._state["progress"]
+        kind = event["t"]
+        
+        if kind == "file":
+            record = {
+                "file_id": event["id"],
+                "status": event["s"],
+                "timestamp_ms": event["ts"]
+            }
+            progress["files_processed"].append(record)
+            self._unspilled.append(record)
+            self._processed_file_ids.add(event["id"])
+            
+            # Update counters
+            if event["s"] == "downloaded":
+                progress["files_downloaded"] += 1
+            elif event["s"] == "skipped":
+                progress["files_skipped"] += 1
+            elif event["s"] == "failed":
+                progress["files_failed"] += 1
+        elif kind == "user":
+            if event["id"] not in self._processed_users:
+                self._processed_users.add(event["id"])
+                progress["users_processed"].append(event["id"])
+                self._settle(event)
+        elif kind == "window":
+            if event["id"] not in self._processed_windows:
+                self._processed_windows.add(event["id"])
+                progress["date_windows_processed"].append(event["id"])
+                self._settle(event)
+        elif kind == "meeting":
+            if event["id"] not in self._processed_meetings:
+                self._processed_meetings.add(event["id"])
+                progress["meetings_processed"].append(event["id"])
+        elif kind == "error":
+            self._state["errors"].append(event["e"])
+    
+    def _settle(self, event: Dict) -> None:
+        """Add the meetings and files a user or window event settles to the settled totals."""
+        progress = self._state["progress"]
+        progress["settled_meetings"] = progress.get("settled_meetings", 0) + event.get("m", 0)
+        progress["settled_files"] = progress.get("settled_files", 0) + event.get("f", 0)
+    
+    def _record(self, event: Dict) -> None:
+        """Apply an event and append it to the journal (lock held)."""
+        self._state["journal_seq"] = event["n"] = self._state.get("journal_seq", 0) + 1
+        self._apply_event(event)
+        
+        try:
+            if self._journal_handle is None:
+                self._journal_handle = open(self.journal_file, 'ab')
+            self._journal_handle.write(json_compat.dumps(event) + b'\n')
+            self._journal_entries += 1
+        except IOError as e:
+            logger.error(f"Failed to write state journal: {e}")
+        
+        self._schedule_flush()
+    
     def _save_state(self) -> None:
-        """Save state to file."""
+        """Save state to file and truncate the journal it now covers."""
+        self._pending = 0
         try:
-            self._state["last_update"] = datetime.utcnow().isoformat() + "Z"
+            self._state["last_update"] = _utcnow_z()
             
-            # Create backup of existing state file
-            if self.state_file.exists():
-                backup_file = self.state_file.with_suffix('.bak')
-                # Remove existing backup if it exists (Windows compatibility)
-                if backup_file.exists():
-                    backup_file.unlink()
-                self.state_file.rename(backup_file)
+            # Move new file records to the files log; the first spill of a
+            # fresh state replaces any log left behind by an earlier run
+            progress = self._state["progress"]
+            if self._unspilled or not progress.get("files_spilled"):
+                with open(self.files_log, 'ab' if progress.get("files_spilled") else 'wb') as f:
+                    f.write(b''.join(json_compat.dumps(record) + b'\n' for record in self._unspilled))
+                self._unspilled = []
+                progress["files_spilled"] = True
             
             # Write new state
-            with open(self.state_file, 'w') as f:
-                json.dump(self._state, f, indent=2)
+            snapshot = dict(self._state, progress=dict(
+                progress, files_processed=list(progress["files_processed"])
+            ))
+            # Write to a temporary file and swap it in, so the state file is
+            # never missing or half-written; os.replace overwrites on Windows too
+            tmp_file = self.state_file.with_suffix('.json.tmp')
+            with open(tmp_file, 'wb') as f:
+                f.write(json_compat.dumps(snapshot, indent=True))
+            os.replace(tmp_file, self.state_file)
+            
+            # Every journal event is now in the state file; the handle is
+            # closed first because Windows can't remove an open file
+            if self._journal_handle is not None:
+                self._journal_handle.close()
+                self._journal_handle = None
+            try:
+                self.journal_file.unlink()
+            except FileNotFoundError:
+                pass
+            self._journal_entries = 0
             
             logger.debug(f"Saved extraction state to {self.state_file}")
             
         except IOError as e:
             logger.error(f"Failed to save state file: {e}")
     
+    def _schedule_flush(self) -> None:
+        """Count an unflushed journal event and make sure a flush is coming (lock held)."""
+        self._pending += 1
+        if self._pending >= self._max_pending:
+            self._flush_journal()
+        elif self._flush_timer is None:
+            self._flush_timer = threading.Timer(self._flush_interval, self._timed_flush)
+            self._flush_timer.daemon = True
+            self._flush_timer.start()
+    
+    def _timed_flush(self) -> None:
+        """Timer callback that flushes events recorded since the last flush."""
+        with self._lock:
+            self._flush_timer = None
+            if self._pending:
+                self._flush_journal()
+    
+    def _flush_journal(self) -> None:
+        """Push buffered journal events to disk, compacting a long journal (lock held)."""
+        self._pending = 0
+        if self._journal_entries >= self._compact_threshold:
+            self._save_state()
+        elif self._journal_handle is not None:
+            try:
+                self._journal_handle.flush()
+            except IOError as e:
+                logger.error(f"Failed to flush state journal: {e}")
+    
+    def flush(self) -> None:
+        """Write any pending progress events to disk now."""
+        with self._lock:
+            if self._flush_timer is not None:
+                self._flush_timer.cancel()
+                self._flush_timer = None
+            if self._pending:
+                self._flush_journal()
+    
+    def close(self) -> None:
+        """Fold the journal into the state file and release it."""
+        with self._lock:
+            if self._flush_timer is not None:
+                self._flush_timer.cancel()
+                self._flush_timer = None
+            if self._journal_entries:
+                self._save_state()
+            elif self._journal_handle is not None:
+                self._journal_handle.close()
+                self._journal_handle = None
+    
     def update_settings(self, settings: Dict) -> None:
         """Update extraction settings in state."""
         with self._lock:
@@ -98,82 +388,113 @@ class ExtractionState:
             self._state["progress"]["total_files"] = total_files
             self._save_state()
     
-    def mark_user_processed(self, user_id: str) -> None:
-        """Mark a user as processed."""
+    def carry_over_totals(self) -> None:
+        """
+        Start a run's totals from the meetings and files settled by earlier runs.
+        
+        Finished users and windows are skipped rather than listed again, so
+        their counts would otherwise be missing from the totals.
+        """
         with self._lock:
-            if user_id not in self._state["progress"]["users_processed"]:
-                self._state["progress"]["users_processed"].append(user_id)
-                self._save_state()
+            progress = self._state["progress"]
+            progress["total_users"] = 0
+            progress["total_meetings"] = progress.get("settled_meetings", 0)
+            progress["total_files"] = progress.get("settled_files", 0)
+            self._save_state()
+    
+    def increment_totals(self, users: int = 0, meetings: int = 0, files: int = 0) -> None:
+        """
+        Add to the total counts as listings arrive.
+        
+        Not saved on its own; the totals are persisted with the next state save.
+        """
+        with self._lock:
+            progress = self._state["progress"]
+            progress["total_users"] += users
+            progress["total_meetings"] += meetings
+            progress["total_files"] += files
+    
+    def mark_user_processed(self, user_id: str, meetings: int = 0, files: int = 0) -> None:
+        """
+        Mark a user as processed.
+        
+        Args:
+            user_id: Zoom user ID
+            meetings: Meetings listed for the user's windows not already marked processed
+            files: Files listed for those windows
+        """
+        with self._lock:
+            if user_id not in self._processed_users:
+                self._record({"t": "user", "id": user_id, "m": meetings, "f": files})
     
-    def mark_date_window_processed(self, user_id: str, start_date: str, end_date: str) -> None:
-        """Mark a date window as processed."""
+    def mark_date_window_processed(self, user_id: str, start_date: str, end_date: str,
+                                   meetings: int = 0, files: int = 0) -> None:
+        """
+        Mark a date window as processed.
+        
+        Args:
+            user_id: Zoom user ID
+            start_date: Window start (YYYY-MM-DD)
+            end_date: Window end (YYYY-MM-DD)
+            meetings: Meetings listed in the window
+            files: Files listed in the window
+        """
         with self._lock:
             window_key = f"{user_id}:{start_date}:{end_date}"
-            if window_key not in self._state["progress"]["date_windows_processed"]:
-                self._state["progress"]["date_windows_processed"].append(window_key)
-                self._save_state()
+            if window_key not in self._processed_windows:
+                self._record({"t": "window", "id": window_key, "m": meetings, "f": files})
     
     def mark_meeting_processed(self, meeting_uuid: str) -> None:
         """Mark a meeting as processed."""
         with self._lock:
-            if meeting_uuid not in self._state["progress"]["meetings_processed"]:
-                self._state["progress"]["meetings_processed"].append(meeting_uuid)
-                self._save_state()
+            if meeting_uuid not in self._processed_meetings:
+                self._record({"t": "meeting", "id": meeting_uuid})
     
     def mark_file_processed(self, file_id: str, status: str) -> None:
         """Mark a file as processed with status."""
         with self._lock:
-            self._state["progress"]["files_processed"].append({
-                "file_id": file_id,
-                "status": status,
-                "timestamp": datetime.utcnow().isoformat() + "Z"
+            self._record({
+                "t": "file",
+                "id": file_id,
+                "s": status,
+                # Epoch milliseconds; far smaller than an ISO string across
+                # the journal, the files log and the state file tail
+                "ts": int(time.time() * 1000)
             })
-            
-            # Update counters
-            if status == "downloaded":
-                self._state["progress"]["files_downloaded"] += 1
-            elif status == "skipped":
-                self._state["progress"]["files_skipped"] += 1
-            elif status == "failed":
-                self._state["progress"]["files_failed"] += 1
-            
-            self._save_state()
     
     def add_error(self, error: Dict) -> None:
         """Add an error to the state."""
         with self._lock:
-            error["timestamp"] = datetime.utcnow().isoformat() + "Z"
-            self._state["errors"].append(error)
-            self._save_state()
+            error["timestamp"] = _utcnow_z()
+            self._record({"t": "error", "e": error})
     
     def is_user_processed(self, user_id: str) -> bool:
         """Check if a user has been processed."""
-        return user_id in self._state["progress"]["users_processed"]
+        return user_id in self._processed_users
     
     def is_date_window_processed(self, user_id: str, start_date: str, end_date: str) -> bool:
         """Check if a date window has been processed."""
         window_key = f"{user_id}:{start_date}:{end_date}"
-        return window_key in self._state["progress"]["date_windows_processed"]
+        return window_key in self._processed_windows
     
     def is_meeting_processed(self, meeting_uuid: str) -> bool:
         """Check if a meeting has been processed."""
-        return meeting_uuid in self._state["progress"]["meetings_processed"]
+        return meeting_uuid in self._processed_meetings
     
     def is_file_processed(self, file_id: str) -> bool:
         """Check if a file has been processed."""
-        for file_record in self._state["progress"]["files_processed"]:
-            if file_record["file_id"] == file_id:
-                return True
-        return False
+        return file_id in self._processed_file_ids
     
     def get_progress_summary(self) -> Dict:
         """Get progress summary."""
         progress = self._state["progress"]
         
-        total_files = progress["total_files"]
         downloaded = progress["files_downloaded"]
         skipped = progress["files_skipped"]
         failed = progress["files_failed"]
+        # Totals count files discovered so far, which can trail the processed
+        # counts carried over from a resumed run
+        total_files = max(progress["total_files"], downloaded + skipped + failed)
         remaining = total_files - (downloaded + skipped + failed)
         
         return {
@@ -202,7 +523,11 @@ class ExtractionState:
     def reset(self) -> None:
         """Reset extraction state."""
         with self._lock:
+            if self._journal_handle is not None:
+                self._journal_handle.flush()
             self._state = self._load_state()
+            self._build_indexes()
+            self._replay_journal()
             self._save_state()
         logger.info("Extraction state reset")
 
@@ -210,27 +535,63 @@ class ExtractionState:
 class InventoryLogger:
     """Manages inventory logging for downloaded files."""
     
-    def __init__(self, inventory_file: Path):
+    _BATCH_SIZE = 500
+    _BATCH_WAIT = 0.25
+    _RECENT_ROWS = 10000
+    
+    def __init__(self, inventory_file: Path, write_jsonl: bool = True):
         """
         Initialize inventory logger.
         
+        Entries are handed to a background writer thread, which appends
+        them to the JSONL log and the database in batches.
+        
         Args:
             inventory_file: Path to inventory log file
+            write_jsonl: Whether to keep the JSONL log next to the database
         """
         self.inventory_file = inventory_file
+        self.write_jsonl = write_jsonl
         self.inventory_file.parent.mkdir(parents=True, exist_ok=True)
         self._lock = threading.Lock()
         
         # Initialize SQLite database for efficient querying
         self.db_file = inventory_file.with_suffix('.db')
+        self._conn: Optional[sqlite3.Connection] = None
         self._init_database()
+        
+        # The JSONL log stays open in append mode between batches
+        self._inventory_handle = None
+        
+        # Hashes of recently logged rows, so re-logging an unchanged file
+        # (retries, resumed runs) doesn't rewrite its row
+        self._recent_lock = threading.Lock()
+        self._recent_order: deque = deque()
+        self._recent_rows: Set[int] = set()
+        self._queue: queue.Queue = queue.Queue()
+        self._writer: Optional[threading.Thread] = threading.Thread(
+            target=self._writer_loop, name="inventory-writer", daemon=True
+        )
+        self._writer.start()
+        atexit.register(self.close)
     
     def _init_database(self) -> None:
-        """Initialize SQLite database for inventory."""
+        """Open the long-lived inventory connection and create the schema."""
         try:
-            conn = sqlite3.connect(self.db_file)
+            # One connection serves every thread; self._lock serializes its use.
+            # isolation_level=None leaves transactions to _write_batch
+            conn = sqlite3.connect(self.db_file, check_same_thread=False,
+                                   isolation_level=None)
             cursor = conn.cursor()
             
+            # WAL lets readers run alongside the writer and, with
+            # synchronous=NORMAL, only syncs at checkpoints, not every commit
+            cursor.execute('PRAGMA journal_mode=WAL')
+            cursor.execute('PRAGMA synchronous=NORMAL')
+            cursor.execute('PRAGMA temp_store=MEMORY')
+            cursor.execute('PRAGMA mmap_size=268435456')
+            cursor.execute('PRAGMA cache_size=-20000')
+            
             # Create inventory table
             cursor.execute('''
                 CREATE TABLE IF NOT EXISTS inventory (
@@ -263,8 +624,7 @@ class InventoryLogger:
             cursor.execute('CREATE INDEX IF NOT EXISTS idx_status ON inventory(status)')
             cursor.execute('CREATE INDEX IF NOT EXISTS idx_timestamp ON inventory(timestamp)')
             
-            conn.commit()
-            conn.close()
+            self._conn = conn
             
             logger.debug(f"Initialized inventory database at {self.db_file}")
             
@@ -286,11 +646,53 @@ class InventoryLogger:
             error_message: Error message if download failed
         """
         success, stats = download_result
+        timestamp = _utcnow_z()
         
-        with self._lock:
-            # Write to JSONL file for human readability
+        # Row for the SQLite database
+        row = (
+            timestamp,
+            user.get("id"),
+            user.get("email"),
+            meeting.get("id"),
+            meeting.get("uuid"),
+            meeting.get("topic"),
+            meeting.get("start_time"),
+            file_info.get("id"),
+            file_info.get("file_type"),
+            file_info.get("file_extension"),
+            stats.get("file_size", 0),
+            stats.get("expected_size"),
+            stats.get("sha256"),
+            str(file_path),
+            file_info.get("download_url"),
+            stats.get("status", "failed"),
+            error_message
+        )
+        
+        if self._writer is None:
+            logger.warning(f"Inventory logger is closed; not logging file {file_info.get('id')}")
+            return
+        
+        # Everything but the timestamp identifies an exact re-log; only the
+        # database row is skipped, the JSONL log keeps every attempt
+        row_hash = hash(row[1:])
+        with self._recent_lock:
+            if row_hash in self._recent_rows:
+                row = None
+            else:
+                self._recent_rows.add(row_hash)
+                self._recent_order.append(row_hash)
+                if len(self._recent_order) > self._RECENT_ROWS:
+                    self._recent_rows.discard(self._recent_order.popleft())
+        
+        if row is None and not self.write_jsonl:
+            return
+        
+        line = None
+        if self.write_jsonl:
+            # JSONL entry for human readability
             inventory_entry = {
-                "timestamp": datetime.utcnow().isoformat() + "Z",
+                "timestamp": timestamp,
                 "user": {
                     "id": user.get("id"),
                     "email": user.get("email")
@@ -314,48 +716,107 @@ class InventoryLogger:
                     "error": error_message
                 }
             }
-            
-            # Append to JSONL file
-            with open(self.inventory_file, 'a', encoding='utf-8') as f:
-                f.write(json.dumps(inventory_entry, ensure_ascii=False) + '\n')
-            
-            # Insert into SQLite database
+            line = json_compat.dumps(inventory_entry) + b'\n'
+        
+        self._queue.put((line, row))
+    
+    def _writer_loop(self) -> None:
+        """Drain queued entries in batches until close() sends None."""
+        while True:
+            item = self._queue.get()
+            batch = [item]
+            deadline = time.monotonic() + self._BATCH_WAIT
+            while item is not None and len(batch) < self._BATCH_SIZE:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                batch.append(item)
+            
+            entries = [entry for entry in batch if entry is not None]
+            if entries:
+                try:
+                    self._write_batch(entries)
+                except Exception as e:
+                    # Keep the writer alive; a dead writer would hang flush()
+                    logger.error(f"Failed to write inventory batch: {e}")
+            for _ in batch:
+                self._queue.task_done()
+            if batch[-1] is None:
+                return
+    
+    def _write_batch(self, entries: List[Tuple[Optional[bytes], Optional[Tuple]]]) -> None:
+        """Append entries to the JSONL log and insert them in one transaction."""
+        with self._lock:
+            lines = [line for line, _ in entries if line is not None]
+            if lines:
+                try:
+                    if self._inventory_handle is None:
+                        self._inventory_handle = open(self.inventory_file, 'ab')
+                    self._inventory_handle.write(b''.join(lines))
+                    self._inventory_handle.flush()
+                except IOError as e:
+                    logger.error(f"Failed to append to inventory log: {e}")
+            
+            if self._conn is None:
+                return
+            
+            rows = [row for _, row in entries if row is not None]
+            if not rows:
+                return
             try:
-                conn = sqlite3.connect(self.db_file)
-                cursor = conn.cursor()
-                
-                cursor.execute('''
-                    INSERT OR REPLACE INTO inventory (
-                        timestamp, user_id, user_email, meeting_id, meeting_uuid,
-                        meeting_topic, meeting_start_time, file_id, file_type,
-                        file_extension, file_size, expected_size, sha256,
-                        file_path, download_url, status, error_message
-                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (
-                    inventory_entry["timestamp"],
-                    user.get("id"),
-                    user.get("email"),
-                    meeting.get("id"),
-                    meeting.get("uuid"),
-                    meeting.get("topic"),
-                    meeting.get("start_time"),
-                    file_info.get("id"),
-                    file_info.get("file_type"),
-                    file_info.get("file_extension"),
-                    stats.get("file_size", 0),
-                    stats.get("expected_size"),
-                    stats.get("sha256"),
-                    str(file_path),
-                    file_info.get("download_url"),
-                    stats.get("status", "failed"),
-                    error_message
-                ))
-                
-                conn.commit()
-                conn.close()
-                
-            except sqlite3.Error as e:
-                logger.error(f"Failed to insert into inventory database: {e}")
+                # Take the write lock up front so the batch can't hit SQLITE_BUSY
+                # halfway through
+                self._conn.execute('BEGIN IMMEDIATE')
+                self._conn.executemany(_INVENTORY_INSERT, rows)
+                self._conn.execute('COMMIT')
+            except sqlite3.Error:
+                if self._conn.in_transaction:
+                    self._conn.execute('ROLLBACK')
+                # Retry row by row so one bad entry doesn't drop the batch
+                try:
+                    self._conn.execute('BEGIN IMMEDIATE')
+                    for row in rows:
+                        try:
+                            self._conn.execute(_INVENTORY_INSERT, row)
+                        except sqlite3.Error as e:
+                            logger.error(f"Failed to insert into inventory database: {e}")
+                    self._conn.execute('COMMIT')
+                except sqlite3.Error as e:
+                    if self._conn.in_transaction:
+                        self._conn.execute('ROLLBACK')
+                    logger.error(f"Failed to write inventory batch: {e}")
+    
+    def flush(self) -> None:
+        """Block until every queued entry has been written."""
+        if self._writer is not None:
+            self._queue.join()
+    
+    def _query(self, sql: str, params: Tuple = ()) -> List[Tuple]:
+        """Run a read query on the shared connection and fetch all rows."""
+        # Let queued entries land first so queries see every logged file
+        self.flush()
+        if self._conn is None:
+            raise sqlite3.OperationalError("inventory database is not available")
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+    
+    def close(self) -> None:
+        """Write out queued entries and close the inventory log and database."""
+        writer, self._writer = self._writer, None
+        if writer is not None:
+            self._queue.put(None)
+            writer.join()
+        with self._lock:
+            if self._inventory_handle is not None:
+                self._inventory_handle.close()
+                self._inventory_handle = None
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
     
     def get_file_status(self, file_id: str) -> Optional[Dict]:
         """
@@ -368,18 +829,13 @@ class InventoryLogger:
             File status dictionary or None if not found
         """
         try:
-            conn = sqlite3.connect(self.db_file)
-            cursor = conn.cursor()
-            
-            cursor.execute('''
+            rows = self._query('''
                 SELECT file_id, file_type, file_size, sha256, file_path, status, error_message
-                FROM inventory WHERE file_id = ?
+                FROM inventory WHERE file_id = ? LIMIT 1
             ''', (file_id,))
             
-            row = cursor.fetchone()
-            conn.close()
-            
-            if row:
+            if rows:
+                row = rows[0]
                 return {
                     "file_id": row[0],
                     "file_type": row[1],
@@ -406,36 +862,18 @@ class InventoryLogger:
             User summary dictionary
         """
         try:
-            conn = sqlite3.connect(self.db_file)
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                SELECT status, COUNT(*), SUM(file_size)
-                FROM inventory WHERE user_id = ? GROUP BY status
-            ''', (user_id,))
+            total_files, downloaded, failed, total_size = self._query(
+                f"SELECT {_INVENTORY_TOTALS} FROM inventory WHERE user_id = ?", (user_id,)
+            )[0]
             
-            results = cursor.fetchall()
-            conn.close()
-            
-            summary = {
+            return {
                 "user_id": user_id,
-                "total_files": 0,
-                "downloaded": 0,
-                "failed": 0,
-                "total_size": 0
+                "total_files": total_files,
+                "downloaded": downloaded,
+                "failed": failed,
+                "total_size": total_size
             }
             
-            for status, count, size in results:
-                summary["total_files"] += count
-                summary["total_size"] += size or 0
-                
-                if status == "success":
-                    summary["downloaded"] = count
-                elif status == "failed":
-                    summary["failed"] = count
-            
-            return summary
-            
         except sqlite3.Error as e:
             logger.error(f"Failed to get user summary: {e}")
             return {"user_id": user_id, "error": str(e)}
@@ -448,46 +886,50 @@ class InventoryLogger:
             Statistics dictionary
         """
         try:
-            conn = sqlite3.connect(self.db_file)
-            cursor = conn.cursor()
-            
-            # Get overall stats
-            cursor.execute('''
-                SELECT status, COUNT(*), SUM(file_size)
-                FROM inventory GROUP BY status
-            ''')
-            
-            results = cursor.fetchall()
-            
-            # Get unique users and meetings
-            cursor.execute('SELECT COUNT(DISTINCT user_id) FROM inventory')
-            unique_users = cursor.fetchone()[0]
-            
-            cursor.execute('SELECT COUNT(DISTINCT meeting_id) FROM inventory')
-            unique_meetings = cursor.fetchone()[0]
-            
-            conn.close()
-            
-            stats = {
-                "total_files": 0,
-                "downloaded": 0,
-                "failed": 0,
-                "total_size": 0,
-                "unique_users": unique_users,
-                "unique_meetings": unique_meetings
+            # Totals and distinct counts in a single pass over the table
+            row = self._query(f'''
+                SELECT {_INVENTORY_TOTALS},
+                       COUNT(DISTINCT user_id), COUNT(DISTINCT meeting_id)
+                FROM inventory
+            ''')[0]
+            
+            return {
+                "total_files": row[0],
+                "downloaded": row[1],
+                "failed": row[2],
+                "total_size": row[3],
+                "unique_users": row[4],
+                "unique_meetings": row[5]
             }
             
-            for status, count, size in results:
-                stats["total_files"] += count
-                stats["total_size"] += size or 0
-                
-                if status == "success":
-                    stats["downloaded"] = count
-                elif status == "failed":
-                    stats["failed"] = count
+        except sqlite3.Error as e:
+            logger.error(f"Failed to get statistics: {e}")
+            return {"error": str(e)}
+    
+    def get_size_histogram(self, bucket_size: int = 1024 * 1024) -> Dict:
+        """
+        Get file counts per size bucket for each status.
+        
+        Bucketing runs in SQLite, so only one row per non-empty bucket
+        comes back to Python.
+        
+        Args:
+            bucket_size: Bucket width in bytes
+            
+        Returns:
+            Dictionary mapping status to {bucket start in bytes: file count}
+        """
+        try:
+            rows = self._query('''
+                SELECT status, COALESCE(file_size, 0) / ? AS bucket, COUNT(*)
+                FROM inventory GROUP BY status, bucket
+            ''', (bucket_size,))
             
-            return stats
+            histogram: Dict[str, Dict[int, int]] = {}
+            for status, bucket, count in rows:
+                histogram.setdefault(status, {})[bucket * bucket_size] = count
+            return histogram
             
         except sqlite3.Error as e:
-            logger.error(f"Failed to get statistics: {e}")
+            logger.error(f"Failed to get size histogram: {e}")
             return {"error": str(e)}
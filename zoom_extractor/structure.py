@@ -5,16 +5,115 @@ Handles deterministic folder structure and file naming for downloaded recordings
 """
 
 import os
-import json
+import csv
 import logging
 import re
-from typing import Dict, List, Optional, Tuple
+import time
+from operator import itemgetter
+from typing import Dict, Iterable, List, Optional, Tuple
 from pathlib import Path
 from datetime import datetime
+from functools import lru_cache
 from urllib.parse import quote
 
+from . import json_compat
+
 logger = logging.getLogger(__name__)
 
+# sanitize_filename replaces invalid characters with "_" and drops control
+# characters in a single str.translate pass
+_SANITIZE_TABLE = str.maketrans({
+    **{char: '_' for char in '<>:"/\\|?*'},
+    **{chr(code): None for code in (*range(0x00, 0x20), *range(0x7f, 0xa0))},
+})
+_UNDERSCORE_RUN_RE = re.compile(r'__+')
+
+
+def _utcnow_z() -> str:
+    """Current UTC time as an ISO 8601 string with a Z suffix."""
+    now = time.time()
+    return f"{time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(now))}.{int(now % 1 * 1e6):06d}Z"
+
+
+@lru_cache(maxsize=4096)
+def _format_timestamp(iso_time: str) -> Optional[str]:
+    """
+    Convert an API ISO 8601 time to the YYYYMMDD_HHMMSS form used in names.
+    
+    Cached because every file of a meeting repeats the same few times.
+    
+    Args:
+        iso_time: Time string such as "2024-01-02T03:04:05Z"
+        
+    Returns:
+        Formatted timestamp, or None if the string can't be parsed
+    """
+    # fromisoformat only accepts a trailing "Z" from Python 3.11
+    if iso_time.endswith('Z'):
+        iso_time = iso_time[:-1] + '+00:00'
+    try:
+        return datetime.fromisoformat(iso_time).strftime("%Y%m%d_%H%M%S")
+    except ValueError:
+        return None
+
+
+def _sanitize(filename: str) -> str:
+    """Apply the character replacements and clean-up of sanitize_filename, without truncation."""
+    # Replace invalid characters and remove control characters
+    sanitized = filename.translate(_SANITIZE_TABLE)
+    
+    # Remove leading/trailing whitespace and dots
+    sanitized = sanitized.strip(' .')
+    
+    # Replace multiple consecutive underscores with single underscore
+    if '__' in sanitized:
+        sanitized = _UNDERSCORE_RUN_RE.sub('_', sanitized)
+    
+    return sanitized
+
+
+@lru_cache(maxsize=4096)
+def _sanitize_cached(filename: str, max_length: int) -> str:
+    """
+    Sanitize and truncate a name for DirectoryStructure.sanitize_filename.
+    
+    Cached because the same topics, emails and file names come up for
+    every file and every run over the same meetings.
+    
+    Args:
+        filename: Original filename
+        max_length: Maximum filename length
+        
+    Returns:
+        Sanitized filename
+    """
+    # Topics can run to thousands of characters; sanitize a prefix first.
+    # Every step only shortens or keeps a prefix, so if the prefix still
+    # yields max_length characters they are the ones the full string gives
+    prefix_length = max_length * 2
+    if len(filename) > prefix_length:
+        sanitized = _sanitize(filename[:prefix_length])
+        if len(sanitized) >= max_length:
+            return sanitized[:max_length]
+    
+    sanitized = _sanitize(filename)
+    
+    # Truncate if too long
+    if len(sanitized) > max_length:
+        sanitized = sanitized[:max_length]
+    
+    # Ensure filename is not empty
+    if not sanitized:
+        sanitized = "unnamed"
+    
+    return sanitized
+
+
+# files.csv columns, named after the download-stats keys they come from
+_CSV_COLUMNS = ("file_id", "file_type", "file_size", "expected_size", "sha256", "status", "download_url")
+_CSV_DEFAULTS = dict.fromkeys(_CSV_COLUMNS, "")
+_csv_row = itemgetter(*_CSV_COLUMNS)
+
 
 class DirectoryStructure:
     """Handles directory structure and file naming for recordings."""
@@ -34,6 +133,23 @@ class DirectoryStructure:
         self.logs_dir = self.base_output_dir / "_logs"
         self.meta_dir.mkdir(exist_ok=True)
         self.logs_dir.mkdir(exist_ok=True)
+        
+        # Directory paths are rebuilt for every file of a meeting; cache them
+        # keyed on every field that goes into the name
+        self._user_dir_cache: Dict[Tuple, Path] = {}
+        self._meeting_dir_cache: Dict[Tuple, Path] = {}
+        
+        # Metadata blocks that are identical for every meeting of a user or
+        # of a date window
+        self._user_meta_cache: Dict[str, Dict] = {}
+        self._window_meta_cache: Dict[Tuple[datetime, datetime], Dict] = {}
+        
+        # check_file_exists runs for every file of a meeting back to back;
+        # one scandir of the meeting directory answers all of them. Only the
+        # last directory is kept and saving the meeting's metadata drops it,
+        # since downloads change the listing
+        self._scanned_dir: Optional[Path] = None
+        self._scanned_entries: Dict[str, os.stat_result] = {}
     
     def sanitize_filename(self, filename: str, max_length: int = 200) -> str:
         """
@@ -46,27 +162,7 @@ class DirectoryStructure:
         Returns:
             Sanitized filename
         """
-        # Remove or replace invalid characters
-        sanitized = re.sub(r'[<>:"/\\|?*]', '_', filename)
-        
-        # Remove control characters
-        sanitized = re.sub(r'[\x00-\x1f\x7f-\x9f]', '', sanitized)
-        
-        # Remove leading/trailing whitespace and dots
-        sanitized = sanitized.strip(' .')
-        
-        # Replace multiple consecutive underscores with single underscore
-        sanitized = re.sub(r'_+', '_', sanitized)
-        
-        # Truncate if too long
-        if len(sanitized) > max_length:
-            sanitized = sanitized[:max_length]
-        
-        # Ensure filename is not empty
-        if not sanitized:
-            sanitized = "unnamed"
-        
-        return sanitized
+        return _sanitize_cached(filename, max_length)
     
     def get_user_directory(self, user: Dict) -> Path:
         """
@@ -81,13 +177,19 @@ class DirectoryStructure:
         user_email = user.get("email", "unknown")
         user_id = user.get("id", "unknown")
         
+        cache_key = (user_email, user_id)
+        cached = self._user_dir_cache.get(cache_key)
+        if cached is not None:
+            return cached
+        
         # Use email if available, otherwise use user ID
         if user_email and user_email != "unknown":
             directory_name = self.sanitize_filename(user_email, 100)
         else:
             directory_name = f"user_{user_id}"
         
-        return self.base_output_dir / directory_name
+        user_dir = self._user_dir_cache[cache_key] = self.base_output_dir / directory_name
+        return user_dir
     
     def get_meeting_directory(self, user: Dict, meeting: Dict) -> Path:
         """
@@ -100,25 +202,28 @@ class DirectoryStructure:
         Returns:
             Path to meeting directory
         """
+        start_time_str = meeting.get("start_time", "")
+        topic = meeting.get("topic", "Untitled Meeting")
+        meeting_id = meeting.get("id", meeting.get("uuid", "unknown"))
+        
+        cache_key = (user.get("email", "unknown"), user.get("id", "unknown"),
+                     start_time_str, topic, meeting_id)
+        cached = self._meeting_dir_cache.get(cache_key)
+        if cached is not None:
+            return cached
+        
         user_dir = self.get_user_directory(user)
         
-        # Parse meeting start time
-        start_time_str = meeting.get("start_time", "")
-        try:
-            start_time = datetime.fromisoformat(start_time_str.replace('Z', '+00:00'))
-        except (ValueError, AttributeError):
+        # Format meeting start time
+        timestamp = _format_timestamp(start_time_str) if isinstance(start_time_str, str) else None
+        if timestamp is None:
             logger.warning(f"Invalid start_time format: {start_time_str}")
-            start_time = datetime.utcnow()
-        
-        # Format timestamp
-        timestamp = start_time.strftime("%Y%m%d_%H%M%S")
+            timestamp = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
         
-        # Get meeting topic
-        topic = meeting.get("topic", "Untitled Meeting")
+        # Sanitize meeting topic
         sanitized_topic = self.sanitize_filename(topic, 100)
         
-        # Get meeting ID
-        meeting_id = meeting.get("id", meeting.get("uuid", "unknown"))
+        # Shorten meeting ID
         if isinstance(meeting_id, str) and len(meeting_id) > 20:
             meeting_id = meeting_id[:20]  # Truncate long UUIDs
         
@@ -126,7 +231,8 @@ class DirectoryStructure:
         dir_name = f"{timestamp}_{sanitized_topic}_{meeting_id}"
         dir_name = self.sanitize_filename(dir_name, 200)
         
-        return user_dir / dir_name
+        meeting_dir = self._meeting_dir_cache[cache_key] = user_dir / dir_name
+        return meeting_dir
     
     def get_file_path(self, user: Dict, meeting: Dict, file_info: Dict) -> Path:
         """
@@ -140,17 +246,52 @@ class DirectoryStructure:
         Returns:
             Path to the file
         """
-        meeting_dir = self.get_meeting_directory(user, meeting)
+        return self.get_meeting_directory(user, meeting) / self._file_name(
+            file_info, meeting.get("processed_files", ()))
+    
+    def _file_name(self, file_info: Dict, siblings: Iterable[Dict] = ()) -> str:
+        """
+        Build the sanitized file name for a recording file.
         
-        # Parse recording start time if available
-        recording_start_str = file_info.get("recording_start", "")
-        if recording_start_str:
-            try:
-                recording_start = datetime.fromisoformat(recording_start_str.replace('Z', '+00:00'))
-                timestamp = recording_start.strftime("%Y%m%d_%H%M%S")
-            except (ValueError, AttributeError):
-                timestamp = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
+        The name is {start}_{FILE_TYPE}.{ext}. Only when another file of the
+        same meeting would get the same name (a meeting can hold several MP4
+        views) is the recording type, or failing that the file id, appended;
+        other names stay as earlier runs wrote them.
+        
+        Args:
+            file_info: File information dictionary
+            siblings: Every file of the meeting, file_info included
+            
+        Returns:
+            File name within the meeting directory
+        """
+        filename = self._base_file_name(file_info)
+        
+        clashes = [other for other in siblings
+                   if other is not file_info and other != file_info
+                   and self._base_file_name(other) == filename]
+        if not clashes:
+            return filename
+        
+        recording_type = file_info.get("recording_type")
+        if recording_type and not any(other.get("recording_type") == recording_type for other in clashes):
+            suffix = recording_type
+        elif recording_type:
+            suffix = f"{recording_type}_{file_info.get('id')}"
         else:
+            suffix = file_info.get("id")
+        
+        stem, dot, extension = filename.rpartition(".")
+        return self.sanitize_filename(f"{stem}_{suffix}{dot}{extension}", 200)
+    
+    def _base_file_name(self, file_info: Dict) -> str:
+        """Build the {start}_{FILE_TYPE}.{ext} file name, before any collision suffix."""
+        # Format recording start time if available
+        recording_start_str = file_info.get("recording_start", "")
+        timestamp = None
+        if recording_start_str and isinstance(recording_start_str, str):
+            timestamp = _format_timestamp(recording_start_str)
+        if timestamp is None:
             timestamp = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
         
         # Get file type and extension
@@ -159,9 +300,7 @@ class DirectoryStructure:
         
         # Create filename
         filename = f"{timestamp}_{file_type.upper()}.{file_extension}"
-        filename = self.sanitize_filename(filename, 200)
-        
-        return meeting_dir / filename
+        return self.sanitize_filename(filename, 200)
     
     def create_meeting_metadata(self, user: Dict, meeting: Dict, date_window: Tuple[datetime, datetime]) -> Dict:
         """
@@ -175,6 +314,24 @@ class DirectoryStructure:
         Returns:
             Metadata dictionary
         """
+        user_block = self._user_meta_cache.get(user.get("id"))
+        if user_block is None:
+            user_block = self._user_meta_cache[user.get("id")] = {
+                "id": user.get("id"),
+                "email": user.get("email"),
+                "first_name": user.get("first_name"),
+                "last_name": user.get("last_name"),
+                "display_name": user.get("display_name")
+            }
+        
+        window_key = (date_window[0], date_window[1])
+        window_block = self._window_meta_cache.get(window_key)
+        if window_block is None:
+            window_block = self._window_meta_cache[window_key] = {
+                "date_window_start": date_window[0].isoformat() + "Z",
+                "date_window_end": date_window[1].isoformat() + "Z"
+            }
+        
         metadata = {
             "meeting": {
                 "id": meeting.get("id"),
@@ -187,17 +344,11 @@ class DirectoryStructure:
                 "account_id": meeting.get("account_id"),
                 "type": meeting.get("type")
             },
-            "user": {
-                "id": user.get("id"),
-                "email": user.get("email"),
-                "first_name": user.get("first_name"),
-                "last_name": user.get("last_name"),
-                "display_name": user.get("display_name")
-            },
+            # Copied so callers editing the result can't alter the cache
+            "user": dict(user_block),
             "extraction": {
-                "extracted_at": datetime.utcnow().isoformat() + "Z",
-                "date_window_start": date_window[0].isoformat() + "Z",
-                "date_window_end": date_window[1].isoformat() + "Z",
+                "extracted_at": _utcnow_z(),
+                **window_block,
                 "total_files": meeting.get("total_files", 0)
             },
             "files": []
@@ -205,6 +356,25 @@ class DirectoryStructure:
         
         return metadata
     
+    def persist_meeting_outputs(self, user: Dict, meeting: Dict, date_window: Tuple[datetime, datetime],
+                                file_results: List[Tuple[bool, Dict]]) -> Tuple[Path, Optional[Path]]:
+        """
+        Save meeting metadata and the files listing in one pass.
+        
+        Args:
+            user: User dictionary from API
+            meeting: Meeting dictionary from API
+            date_window: Date window tuple (start, end)
+            file_results: List of download results
+            
+        Returns:
+            Tuple of (metadata file path, CSV file path or None if no files)
+        """
+        meeting_dir = self._prepare_meeting_directory(user, meeting)
+        metadata_file = self._write_meeting_metadata(meeting_dir, user, meeting, date_window, file_results)
+        csv_file = self._write_files_csv(meeting_dir, file_results)
+        return metadata_file, csv_file
+    
     def save_meeting_metadata(self, user: Dict, meeting: Dict, date_window: Tuple[datetime, datetime], 
                             file_results: List[Tuple[bool, Dict]]) -> Path:
         """
@@ -219,9 +389,35 @@ class DirectoryStructure:
         Returns:
             Path to metadata file
         """
+        meeting_dir = self._prepare_meeting_directory(user, meeting)
+        return self._write_meeting_metadata(meeting_dir, user, meeting, date_window, file_results)
+    
+    def save_files_csv(self, user: Dict, meeting: Dict, file_results: List[Tuple[bool, Dict]]) -> Optional[Path]:
+        """
+        Save files listing to CSV file.
+        
+        Args:
+            user: User dictionary from API
+            meeting: Meeting dictionary from API
+            file_results: List of download results
+            
+        Returns:
+            Path to CSV file or None if no files
+        """
+        return self._write_files_csv(self.get_meeting_directory(user, meeting), file_results)
+    
+    def _prepare_meeting_directory(self, user: Dict, meeting: Dict) -> Path:
+        """Create a meeting's directory and drop its cached listing, which is about to change."""
         meeting_dir = self.get_meeting_directory(user, meeting)
         meeting_dir.mkdir(parents=True, exist_ok=True)
-        
+        if meeting_dir == self._scanned_dir:
+            self._scanned_dir = None
+        return meeting_dir
+    
+    def _write_meeting_metadata(self, meeting_dir: Path, user: Dict, meeting: Dict,
+                                date_window: Tuple[datetime, datetime],
+                                file_results: List[Tuple[bool, Dict]]) -> Path:
+        """Write meta.json into an existing meeting directory."""
         metadata = self.create_meeting_metadata(user, meeting, date_window)
         
         # Add file information
@@ -239,48 +435,31 @@ class DirectoryStructure:
         
         # Save metadata file
         metadata_file = meeting_dir / "meta.json"
-        with open(metadata_file, 'w', encoding='utf-8') as f:
-            json.dump(metadata, f, indent=2, ensure_ascii=False)
+        with open(metadata_file, 'wb', buffering=1 << 16) as f:
+            f.write(json_compat.dumps(metadata, indent=True))
         
         logger.debug(f"Saved metadata to {metadata_file}")
         return metadata_file
     
-    def save_files_csv(self, user: Dict, meeting: Dict, file_results: List[Tuple[bool, Dict]]) -> Optional[Path]:
-        """
-        Save files listing to CSV file.
-        
-        Args:
-            user: User dictionary from API
-            meeting: Meeting dictionary from API
-            file_results: List of download results
-            
-        Returns:
-            Path to CSV file or None if no files
-        """
+    def _write_files_csv(self, meeting_dir: Path, file_results: List[Tuple[bool, Dict]]) -> Optional[Path]:
+        """Write files.csv into an existing meeting directory, or nothing if there are no files."""
         if not file_results:
             return None
         
-        meeting_dir = self.get_meeting_directory(user, meeting)
-        
         csv_file = meeting_dir / "files.csv"
         
-        with open(csv_file, 'w', encoding='utf-8') as f:
+        rows = [
+            _csv_row({**_CSV_DEFAULTS, **file_stats})
+            for success, file_stats in file_results
+        ]
+        
+        with open(csv_file, 'w', newline='', encoding='utf-8', buffering=1 << 16) as f:
             # Write CSV header
-            f.write("file_id,file_type,file_size,expected_size,sha256,status,download_url\n")
+            f.write(",".join(_CSV_COLUMNS) + "\n")
             
-            # Write file data
-            for success, file_stats in file_results:
-                file_id = file_stats.get("file_id", "")
-                file_type = file_stats.get("file_type", "")
-                file_size = file_stats.get("file_size", "")
-                expected_size = file_stats.get("expected_size", "")
-                sha256 = file_stats.get("sha256", "")
-                status = file_stats.get("status", "")
-                download_url = file_stats.get("download_url", "")
-                
-                # Escape CSV values
-                csv_line = f'"{file_id}","{file_type}","{file_size}","{expected_size}","{sha256}","{status}","{download_url}"\n'
-                f.write(csv_line)
+            # Write file data; csv escapes quotes embedded in values
+            writer = csv.writer(f, quoting=csv.QUOTE_ALL, lineterminator="\n")
+            writer.writerows(rows)
         
         logger.debug(f"Saved files CSV to {csv_file}")
         return csv_file
@@ -308,7 +487,7 @@ class DirectoryStructure:
         success, stats = download_result
         
         inventory_entry = {
-            "timestamp": datetime.utcnow().isoformat() + "Z",
+            "timestamp": _utcnow_z(),
             "user": {
                 "id": user.get("id"),
                 "email": user.get("email")
@@ -333,9 +512,37 @@ class DirectoryStructure:
         }
         
         # Append to inventory log
-        inventory_file = self.get_inventory_log_path()
-        with open(inventory_file, 'a', encoding='utf-8') as f:
-            f.write(json.dumps(inventory_entry, ensure_ascii=False) + '\n')
+        with open(self.get_inventory_log_path(), 'ab') as f:
+            f.write(json_compat.dumps(inventory_entry) + b'\n')
+    
+    def _scan_directory(self, directory: Path) -> Dict[str, os.stat_result]:
+        """
+        Stat every entry of a directory with a single scandir, reusing the
+        result while the same directory is asked for again.
+        
+        Args:
+            directory: Directory to scan
+            
+        Returns:
+            Mapping of entry name to stat result (empty if the directory is missing)
+        """
+        if directory == self._scanned_dir:
+            return self._scanned_entries
+        
+        entries: Dict[str, os.stat_result] = {}
+        try:
+            with os.scandir(directory) as it:
+                for entry in it:
+                    try:
+                        entries[entry.name] = entry.stat()
+                    except OSError:
+                        continue
+        except FileNotFoundError:
+            pass
+        
+        self._scanned_dir = directory
+        self._scanned_entries = entries
+        return entries
     
     def check_file_exists(self, user: Dict, meeting: Dict, file_info: Dict) -> Tuple[bool, Optional[Path]]:
         """
@@ -349,15 +556,20 @@ class DirectoryStructure:
         Returns:
             Tuple of (exists_and_valid, file_path)
         """
-        file_path = self.get_file_path(user, meeting, file_info)
+        # Look the name up in the cached directory listing before joining it
+        # into a Path, which is only needed for the return value
+        meeting_dir = self.get_meeting_directory(user, meeting)
+        filename = self._file_name(file_info, meeting.get("processed_files", ()))
+        file_path = meeting_dir / filename
         
-        if not file_path.exists():
+        entry = self._scan_directory(meeting_dir).get(filename)
+        if entry is None:
             return False, file_path
+        actual_size = entry.st_size
         
         # Check file size
         expected_size = file_info.get("file_size")
         if expected_size:
-            actual_size = file_path.stat().st_size
             if actual_size != expected_size:
                 logger.debug(f"File {file_path} size mismatch: expected {expected_size}, got {actual_size}")
                 return False, file_path
@@ -6,26 +6,54 @@ Handles listing and filtering Zoom users with pagination support.
 
 import logging
 import requests
-from typing import List, Dict, Optional, Iterator
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Optional, Iterator, Set
 from datetime import datetime
 
+from . import json_compat
+
 logger = logging.getLogger(__name__)
 
+# /users accepts large pages; fall back to Zoom's default page size if a
+# tenant rejects the larger one
+_USERS_PAGE_SIZE = 300
+_FALLBACK_PAGE_SIZE = 30
+
 
 class UserEnumerator:
     """Handles enumeration of Zoom users with pagination and filtering."""
     
-    def __init__(self, auth_headers: Dict[str, str], auth=None):
+    def __init__(self, auth_headers: Dict[str, str], auth=None,
+                 session: Optional[requests.Session] = None):
         """
         Initialize user enumerator.
         
         Args:
             auth_headers: Authorization headers for API requests
             auth: Optional ZoomAuth instance for automatic token refresh
+            session: Optional requests.Session to share (one is created if omitted)
         """
         self.auth_headers = auth_headers
         self.auth = auth
         self.base_url = "https://api.zoom.us/v2"
+        
+        # Keep-alive session so paginated calls reuse one TLS connection.
+        # Transient 5xx are retried in the adapter; 429 is left to callers
+        # since Zoom's daily-limit Retry-After can be hours
+        self._owns_session = session is None
+        if session is None:
+            session = requests.Session()
+            retry = Retry(total=5, backoff_factor=0.5, status_forcelist=(500, 502, 503, 504),
+                          raise_on_status=False)
+            session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=retry))
+        self.session = session
+    
+    def close(self) -> None:
+        """Close the HTTP session if this enumerator created it."""
+        if self._owns_session:
+            self.session.close()
     
     def _get_headers(self) -> Dict[str, str]:
         """Get fresh auth headers, refreshing token if needed."""
@@ -47,12 +75,15 @@ class UserEnumerator:
         """
         url = f"{self.base_url}/users"
         params = {
-            "page_size": 30,  # Maximum allowed by Zoom API
+            "page_size": _USERS_PAGE_SIZE,
             "status": user_type
         }
         
         next_page_token = None
         
+        # Normalize the filter once rather than for every user on every page
+        filter_set = {item.lower().strip() for item in user_filter} if user_filter else None
+        
         while True:
             if next_page_token:
                 params["next_page_token"] = next_page_token
@@ -60,15 +91,20 @@ class UserEnumerator:
             logger.debug(f"Fetching users page with params: {params}")
             
             try:
-                response = requests.get(url, headers=self._get_headers(), params=params, timeout=30)
+                response = self.session.get(url, headers=self._get_headers(), params=params, timeout=30)
+                if (response.status_code == 400 and not next_page_token
+                        and params["page_size"] != _FALLBACK_PAGE_SIZE):
+                    logger.warning(f"page_size={params['page_size']} rejected, retrying with {_FALLBACK_PAGE_SIZE}")
+                    params["page_size"] = _FALLBACK_PAGE_SIZE
+                    continue
                 response.raise_for_status()
                 
-                data = response.json()
+                data = json_compat.loads(response.content)
                 users = data.get("users", [])
                 
                 # Filter users if filter is provided
-                if user_filter:
-                    users = self._filter_users(users, user_filter)
+                if filter_set:
+                    users = self._filter_users(users, filter_set)
                 
                 for user in users:
                     yield user
@@ -80,33 +116,25 @@ class UserEnumerator:
                     
                 logger.debug(f"Found {len(users)} users, continuing to next page")
                 
-            except requests.exceptions.RequestException as e:
+            except (requests.exceptions.RequestException, ValueError) as e:
                 logger.error(f"Failed to fetch users: {e}")
                 raise
     
-    def _filter_users(self, users: List[Dict], user_filter: List[str]) -> List[Dict]:
+    def _filter_users(self, users: List[Dict], filter_set: Set[str]) -> List[Dict]:
         """
         Filter users based on email or ID.
         
         Args:
             users: List of user dictionaries
-            user_filter: List of emails or user IDs to filter by
+            filter_set: Lowercased, stripped emails or user IDs to filter by
             
         Returns:
             Filtered list of users
         """
-        filtered_users = []
-        
-        for user in users:
-            user_email = user.get("email", "").lower()
-            user_id = user.get("id", "")
-            
-            # Check if user matches any filter criteria
-            for filter_item in user_filter:
-                filter_item = filter_item.lower().strip()
-                if filter_item == user_email or filter_item == user_id:
-                    filtered_users.append(user)
-                    break
+        filtered_users = [
+            user for user in users
+            if user.get("email", "").lower() in filter_set or user.get("id", "") in filter_set
+        ]
         
         logger.debug(f"Filtered {len(users)} users down to {len(filtered_users)} based on filter")
         return filtered_users
@@ -127,15 +155,35 @@ class UserEnumerator:
             encoded_email = quote(email, safe='')
             
             url = f"{self.base_url}/users/{encoded_email}"
-            response = requests.get(url, headers=self._get_headers(), timeout=30)
+            response = self.session.get(url, headers=self._get_headers(), timeout=30)
             response.raise_for_status()
             
-            return response.json()
+            return json_compat.loads(response.content)
             
-        except requests.exceptions.RequestException as e:
+        except (requests.exceptions.RequestException, ValueError) as e:
             logger.warning(f"Failed to get user by email {email}: {e}")
             return None
     
+    def get_users_by_emails(self, emails: List[str], max_workers: int = 8) -> List[Optional[Dict]]:
+        """
+        Look up several users by email concurrently.
+        
+        Lookups share the session's connection pool; a session with a
+        TokenBucketAdapter mounted keeps them within Zoom's rate limits.
+        
+        Args:
+            emails: User email addresses
+            max_workers: Maximum number of lookups in flight
+            
+        Returns:
+            User dictionaries (None where not found) in the order of emails
+        """
+        if len(emails) <= 1:
+            return [self.get_user_by_email(email) for email in emails]
+        
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(emails))) as executor:
+            return list(executor.map(self.get_user_by_email, emails))
+    
     def get_user_by_id(self, user_id: str) -> Optional[Dict]:
         """
         Get a specific user by user ID.
@@ -148,12 +196,12 @@ class UserEnumerator:
         """
         try:
             url = f"{self.base_url}/users/{user_id}"
-            response = requests.get(url, headers=self._get_headers(), timeout=30)
+            response = self.session.get(url, headers=self._get_headers(), timeout=30)
             response.raise_for_status()
             
-            return response.json()
+            return json_compat.loads(response.content)
             
-        except requests.exceptions.RequestException as e:
+        except (requests.exceptions.RequestException, ValueError) as e:
             logger.warning(f"Failed to get user by ID {user_id}: {e}")
             return None
 